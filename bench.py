@@ -0,0 +1,271 @@
+"""
+Benchmarks for the engine, battles and actions per second for a few
+matchups plus the hot paths on their own.
+
+    python bench.py                       # print the numbers
+    python bench.py --save base.json      # keep them as a baseline
+    python bench.py --compare base.json   # flag anything that got slower
+    python bench.py --profile             # time per action type instead
+    python bench.py --scaling             # actions/s from 1v1 to 20v20
+
+Every number is a rate, higher is better, and the best of --repeat
+timings. Compare exits with status 1 when something drops by more than
+--threshold, so only compare runs from the same machine.
+"""
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+
+from main import *
+import loadouts
+
+
+# ------------ matchups ---------------
+
+def team(size, cards, name, colour):
+    # the first mech holds the frontline, everyone else the backline
+    mechs = [loadouts.build(f'{name}{i}', cards, colour) for i in range(size)]
+    mechs[0].backline = False
+    for mech in mechs[1:]:
+        mech.frontline = False
+    return mechs
+
+
+def versus(size):
+    return lambda: [
+        *team(size, loadouts.BIG_TUMPO, 'BigTumpo', 'blue'),
+        *team(size, loadouts.LIL_UZI, 'LilUzi', 'red'),
+    ]
+
+
+MATCHUPS = {
+    'BigTumpo vs LilUzi': versus(1),
+    '2v2': versus(2),
+    '4v4': versus(4),
+}
+
+
+def bench_matchup(make_mechs, battles, repeat):
+    # the same seeds every time, best of `repeat`, building mechs is not timed
+    best, actions = float('inf'), 0
+    for _ in range(repeat):
+        games = [BattleManager(make_mechs(), seed=split_seed(0, i))
+            for i in range(battles)]
+        start = time.perf_counter()
+        for game in games:
+            game.simulate()
+        best = min(best, time.perf_counter() - start)
+        actions = sum(game.actions for game in games)
+    return battles / best, actions / best
+
+
+def profile_matchup(make_mechs, battles):
+    # where the time goes, per action type, over the same seeds,
+    # and how often reaction eligibility came from the cache
+    profile = Profile()
+    hits = misses = 0
+    for i in range(battles):
+        game = BattleManager(make_mechs(), seed=split_seed(0, i), profile=True)
+        game.simulate()
+        profile.merge(game.profile)
+        hits += game.eligible_hits
+        misses += game.eligible_misses
+    return profile, hits, misses
+
+
+# ------------ scaling ---------------
+
+SIZES = (1, 2, 5, 10, 20)
+
+
+def skirmish(size):
+    # both decks and both lines on each side, so mechs melt down
+    # and the lines change as the battle goes
+    def make_mechs():
+        mechs = []
+        for colour in 'blue', 'red':
+            for i in range(size):
+                cards = (loadouts.BIG_TUMPO, loadouts.LIL_UZI)[i % 2]
+                mech = loadouts.build(f'{colour}{i}', cards, colour)
+                mech.frontline, mech.backline = i % 2 == 0, i % 2 == 1
+                mechs.append(mech)
+        return mechs
+    return make_mechs
+
+
+def scaling(sizes=SIZES, battles=200, repeat=5):
+    # (size, actions/s, against the smallest size), about as many
+    # actions for every size, the rate should stay flat
+    rows = []
+    for size in sizes:
+        _, per_action = bench_matchup(skirmish(size), max(4, battles // size), repeat)
+        rows.append((size, per_action, per_action / rows[0][1] if rows else 1.0))
+    return rows
+
+
+# ------------ hot paths ---------------
+
+def full_hands():
+    # both mechs with everything drawn, every reaction in hand
+    mechs = versus(1)()
+    game = BattleManager(mechs, seed=0)
+    for mech in mechs:
+        while mech.deck:
+            DrawCardAction(mech)(game)
+    return game, mechs
+
+
+def stats_parse():
+    return lambda: Stats.parse("+3HULL -AGI")
+
+
+def stats_parse_uncached():
+    return lambda: Stats._parse("+3HULL -AGI")
+
+
+def mech_stats():
+    game, (mech, _) = full_hands()
+    return lambda: mech.stats
+
+
+def possible_reactions():
+    game, (tumpo, uzi) = full_hands()
+    game.then(AttackAction(phase=PHASE_DEAL_REACTOR_STRESS,
+        source=tumpo, target=uzi, reactor_damage=4))
+    return game.getPossibleReactions
+
+
+def attack_call():
+    # one accuracy roll, put back the way it was after every call
+    game, (tumpo, uzi) = full_hands()
+    attack = AttackAction(phase=PHASE_ROLL_ACCURACY, source=tumpo, target=uzi,
+        attack_skill=Stats.parse("+1"), defense_skill=Stats.parse("+AGI"))
+
+    def call():
+        attack.phase = PHASE_ROLL_ACCURACY
+        attack(game)
+        game.pending.clear()
+    return call
+
+
+def distance_to():
+    game, (tumpo, uzi) = full_hands()
+    return lambda: tumpo.distanceTo(uzi)
+
+
+MICRO = {
+    'Stats.parse': stats_parse,
+    'Stats._parse': stats_parse_uncached,
+    'BattleMech.stats': mech_stats,
+    'getPossibleReactions': possible_reactions,
+    'AttackAction.__call__': attack_call,
+    'distanceTo': distance_to,
+}
+
+
+def bench_micro(setup, repeat):
+    # best of `repeat` timings, each long enough to be worth timing
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number))
+    return number / best
+
+
+# ------------ reports ---------------
+
+def run(battles=200, repeat=5, only=None):
+    results = {}
+    for name, make_mechs in MATCHUPS.items():
+        if only and only not in name:
+            continue
+        per_battle, per_action = bench_matchup(make_mechs, battles, repeat)
+        results[f'{name} battles/s'] = per_battle
+        results[f'{name} actions/s'] = per_action
+
+    for name, setup in MICRO.items():
+        if only and only not in name:
+            continue
+        results[f'{name} calls/s'] = bench_micro(setup, repeat)
+
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    # (name, before, after, change) for every shared result, and the regressions
+    rows, slower = [], []
+    for name, after in current['results'].items():
+        if (before := baseline['results'].get(name)) is None:
+            continue
+        change = after / before - 1
+        rows.append((name, before, after, change))
+        if change < -threshold:
+            slower.append(name)
+    return rows, slower
+
+
+def table(rows):
+    width = max(len(row[0]) for row in rows)
+    return '\n'.join(
+        f'{name:<{width}} ' + ' '.join(f'{v:>14,.0f}' for v in values) +
+        (f' {change:>+7.1%}' if change is not None else '')
+        for name, *values, change in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--battles', type=int, default=200,
+        help='seeded battles per matchup')
+    parser.add_argument('--repeat', type=int, default=5,
+        help='timings per benchmark, the best one counts')
+    parser.add_argument('--only', help='run the benchmarks with this in their name')
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+        help='slowdown that counts as a regression')
+    parser.add_argument('--profile', action='store_true',
+        help='print where each matchup spends its time instead')
+    parser.add_argument('--scaling', action='store_true',
+        help='print actions/s for ever bigger skirmishes instead')
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        for size, per_action, ratio in scaling(battles=args.battles, repeat=args.repeat):
+            print(f'{size:>3}v{size:<3} actions/s {per_action:>10,.0f} {ratio:>6.2f}')
+        return 0
+
+    if args.profile:
+        for name, make_mechs in MATCHUPS.items():
+            if not args.only or args.only in name:
+                profile, hits, misses = profile_matchup(make_mechs, args.battles)
+                print(f'{name}\n{profile.table()}')
+                print(f'canReactTo cache hits :: {hits} of {hits + misses}\n')
+        return 0
+
+    current = run(args.battles, args.repeat, args.only)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if not args.compare:
+        print(table([(n, v, None) for n, v in current['results'].items()]))
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    rows, slower = compare(baseline, current, args.threshold)
+    print(table(rows))
+    for name in slower:
+        print(f'REGRESSION :: {name}')
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Exact outcome distributions for small matchups, no sampling.
+
+Decks are never shuffled, so the only chance in a battle is the
+BattleManager.random calls: who acts when several mechs could, and
+whatever the pilots and cards leave to chance. Branching stands in for
+BattleManager.random and makes each of those calls take every value in
+turn. The battle is searched one turn at a time through snapshots,
+and every state between turns is memoized. That state is each mech's
+hand, deck position, stress, heat and lines, which stays small for
+12-card decks.
+
+The battle runs on the real engine with the mechs' own pilots. Those
+pilots may use gamestate.random (every choice becomes a branch), but
+must not keep their own state between decisions.
+
+    python exact.py     # exact against Monte Carlo, time and error
+"""
+import copy
+import time
+import itertools
+
+from fractions import Fraction
+from collections import defaultdict
+
+from main import BattleManager, split_seed
+from montecarlo import Encounter, skill_percentile
+
+
+class Branching:
+    """
+    Plays a script of choice indexes, then the first option of every
+    choice after it, keeping each call's (index, number of options).
+    """
+    def __init__(self):
+        self.script = []
+        self.made = []
+
+    def start(self, script):
+        self.script = script
+        self.made = []
+
+    def pick(self, n):
+        depth = len(self.made)
+        index = self.script[depth] if depth < len(self.script) else 0
+        self.made.append((index, n))
+        return index
+
+    def choice(self, seq):
+        return seq[self.pick(len(seq))]
+
+    def shuffle(self, items):
+        orders = list(itertools.permutations(items))
+        items[:] = orders[self.pick(len(orders))]
+
+    # nothing to save, snapshots only need to put back the battle
+    def getstate(self):
+        return None
+
+    def setstate(self, state):
+        pass
+
+    def seed(self, seed=None):
+        pass
+
+
+def branches(made):
+    # every script after this one, odometer order, and the
+    # probability of the choices in `made`
+    p = Fraction(1)
+    for _, n in made:
+        p /= n
+    for depth in reversed(range(len(made))):
+        index, n = made[depth]
+        if index + 1 < n:
+            return p, [i for i, _ in made[:depth]] + [index + 1]
+    return p, None
+
+
+class ExactBattle:
+    def __init__(self, mechs):
+        self.game = BattleManager(copy.deepcopy(mechs))
+        self.game.random = self.random = Branching()
+        self.ids = {id(c): i for i, c in enumerate(self.game.cards)}
+        self.memo = {}
+        self.turns = 0
+
+    def state(self):
+        # everything between turns that the rest of the battle depends on
+        return tuple(
+            (m.half_stress, m.heat, m.melted, m.frontline, m.backline,
+                len(m.deck), tuple(self.ids[id(c)] for c in m.hand))
+            for m in self.game.mechs)
+
+    def outcome(self):
+        result = self.game.result
+        return result.winner, result.stress, result.heat, result.reason
+
+    def distribution(self):
+        """
+        {(winner, stress, heat, reason): probability} for the battle
+        from its current state, stress and heat per mech.
+        """
+        game = self.game
+        if game.result is not None:
+            return {self.outcome(): Fraction(1)}
+
+        key = self.state()
+        if (known := self.memo.get(key)) is not None:
+            return known
+
+        snapshot = game.snapshot()
+        total = defaultdict(Fraction)
+        script = []
+        while script is not None:
+            game.restore(snapshot)
+            self.random.start(script)
+            game.turn()
+            self.turns += 1
+
+            p, script = branches(self.random.made)
+            for outcome, q in self.distribution().items():
+                total[outcome] += p * q
+
+        game.restore(snapshot)
+        self.memo[key] = dict(total)
+        return self.memo[key]
+
+
+def exact_distribution(mechs):
+    return ExactBattle(mechs).distribution()
+
+
+def margin(mechs, stress, team):
+    # reactor stress dealt minus taken, as in montecarlo.outcome
+    dealt = sum(s for m, s in zip(mechs, stress) if m.team != team)
+    taken = sum(s for m, s in zip(mechs, stress) if m.team == team)
+    return dealt - taken
+
+
+def exact_encounter(team_a, team_b, skill_a=0, skill_b=0, distribution=None):
+    """
+    The README's percentile rule on the exact distribution of reactor
+    stress dealt minus taken by team a.
+    """
+    mechs = [*team_a, *team_b]
+    if distribution is None:
+        distribution = exact_distribution(mechs)
+
+    outcomes = defaultdict(Fraction)
+    for (_, stress, _, _), p in distribution.items():
+        outcomes[margin(mechs, stress, team_a[0].team)] += p
+    return ExactEncounter(outcomes, skill_percentile(skill_a, skill_b))
+
+
+class ExactEncounter(Encounter):
+    def __init__(self, outcomes, percentile):
+        self.probabilities = dict(sorted(outcomes.items()))
+        self.outcomes = list(self.probabilities)
+        self.percentile = percentile
+
+    @property
+    def pick(self):
+        # what Encounter.pick tends to with ever more games
+        cumulative = 0
+        for outcome, p in self.probabilities.items():
+            cumulative += p
+            if cumulative > self.percentile:
+                return outcome
+        return self.outcomes[-1]
+
+
+def win_rate(distribution, team):
+    return sum(p for (winner, *_), p in distribution.items() if winner == team)
+
+
+def compare(team_a, team_b, games=(100, 1000, 10000)):
+    """
+    Exact against Monte Carlo on one matchup. Yields rows of (method,
+    seconds, mean stress margin of team a, its error, median margin).
+    """
+    mechs = [*team_a, *team_b]
+    team = team_a[0].team
+
+    start = time.perf_counter()
+    encounter = exact_encounter(team_a, team_b)
+    mean = sum(m * p for m, p in encounter.probabilities.items())
+    yield 'exact', time.perf_counter() - start, float(mean), 0.0, encounter.pick
+
+    for n in games:
+        start = time.perf_counter()
+        margins = [
+            margin(mechs, BattleManager(copy.deepcopy(mechs),
+                seed=split_seed(0, i)).simulate().stress, team)
+            for i in range(n)]
+        pick = Encounter(margins, 0.5).pick
+        sampled = sum(margins) / n
+        yield (f'{n} games', time.perf_counter() - start,
+            float(sampled), float(abs(sampled - mean)), pick)
+
+
+if __name__ == '__main__':
+    import main
+    import loadouts
+
+    # LilUzi vs BigTumpo always ends the same way, Dodgy has dice to roll
+    dodgy = loadouts.build('Dodgy', [main.CARDS[c] for c in (
+        'StabNSlice', 'JetBoost', 'EmergencyCoolant', 'Sidestep',
+        'StabNSlice', 'JetBoost', 'GMSProcessor', 'ShootPistol',
+        'FuelInjectors', 'JetBoost', 'StabNSlice', 'BurstFire',
+    )], 'red')
+    uzi = loadouts.build('LilUzi', loadouts.LIL_UZI, 'red')
+    tumpo = loadouts.build('BigTumpo', loadouts.BIG_TUMPO, 'blue')
+
+    for team_a, team_b in ([uzi], [tumpo]), ([dodgy], [tumpo]):
+        print(f'{team_a[0].name} vs {team_b[0].name}')
+        print(f'{"method":>12} {"seconds":>8} {"mean":>7} {"error":>7} {"p50":>6}')
+        for method, seconds, mean, error, pick in compare(team_a, team_b):
+            print(f'{method:>12} {seconds:>8.3f} {mean:>7.4f} {error:>7.4f} {str(pick):>6}')
+        print()
@@ -0,0 +1,273 @@
+"""
+Per-battle results as columns on disk, one row per battle, written as
+the battles are played.
+
+A results folder holds numbered shards, either .npy files (one NumPy
+structured array each) or .csv files, never both. Writers only ever add
+shards, a shard is renamed into place once it is complete, and at most
+one shard of rows is held in memory. Read .npy folders with shards(),
+which memory-maps them, or either kind row by row with read().
+
+Every row has the battle's seed, winner, actions and reason, then the
+team, loadout, stress, heat and cards played of each mech in
+BattleManager order. Teams and the winner are indexes into the teams in
+order of first appearance (-1 for a draw), reasons index REASONS,
+stress is in half points and loadouts are a hash of chassis and deck.
+
+    python export.py results/ --battles 1000         # play, add shards
+    python export.py results/ --show                 # summarize them
+
+NumPy is only needed for .npy shards.
+"""
+import os
+import csv
+import sys
+import glob
+import hashlib
+import argparse
+
+import loadouts
+
+from main import (BattleManager, split_seed, HALF_POINTS, MAX_ACTIONS,
+    REASON_ELIMINATED, REASON_OUT_OF_CARDS, REASON_MAX_ACTIONS)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+SHARD_ROWS = 10_000
+
+REASONS = (REASON_ELIMINATED, REASON_OUT_OF_CARDS, REASON_MAX_ACTIONS)
+
+SCALARS = (('seed', 'u8'), ('winner', 'i1'), ('actions', 'i4'), ('reason', 'i1'))
+PER_MECH = (('team', 'i1'), ('loadout', 'u8'), ('stress', 'i2'), ('heat', 'i2'),
+    ('played', 'i2'))
+
+FORMATS = ('npy', 'csv')
+
+
+def loadout_hash(chassis, cards):
+    # 64 bits, like the seeds from split_seed
+    text = '/'.join((chassis, *cards))
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'little')
+
+
+def summarize(game, seed):
+    # the row for a finished battle, game.cards still knows every loadout
+    teams = list(dict.fromkeys(m.team for m in game.mechs))
+    result = game.result
+
+    cards = [[] for _ in game.mechs]
+    played = [0] * len(game.mechs)
+    for card in game.cards:
+        mech = card.mech
+        cards[mech.index].append(type(card).__name__)
+        # gone from deck and hand, and not scrapped by a reaction
+        if not card.scrapped and card not in mech.deck and card not in mech.hand:
+            played[mech.index] += 1
+
+    return {
+        'seed': seed,
+        'winner': -1 if result.winner is None else teams.index(result.winner),
+        'actions': result.actions,
+        'reason': REASONS.index(result.reason),
+        'team': tuple(teams.index(m.team) for m in game.mechs),
+        'loadout': tuple(loadout_hash(type(m).__name__, c)
+            for m, c in zip(game.mechs, cards)),
+        'stress': tuple(int(s * HALF_POINTS) for s in result.stress),
+        'heat': result.heat,
+        'played': tuple(played),
+    }
+
+
+def battles(make_mechs, seeds, max_actions=MAX_ACTIONS):
+    """
+    Play one battle per seed between fresh mechs from make_mechs(),
+    yields their rows as they finish.
+    """
+    for seed in seeds:
+        game = BattleManager(make_mechs(), seed=seed)
+        game.simulate(max_actions)
+        yield summarize(game, seed)
+
+
+# ------------ writing ---------------
+
+def shard_paths(folder):
+    # finished shards only, not a .tmp left by a writer that died
+    return sorted(path for format in FORMATS
+        for path in glob.glob(os.path.join(folder, '[0-9]' * 5 + '.' + format)))
+
+
+class Shards:
+    """
+    Appends rows to a results folder, a shard every `rows` rows and one
+    more for whatever is left on close().
+    """
+    def __init__(self, folder, format='npy', rows=SHARD_ROWS):
+        if format not in FORMATS:
+            raise ValueError(f'unknown format {format}')
+        if format == 'npy' and np is None:
+            raise RuntimeError('.npy shards need numpy')
+
+        paths = shard_paths(folder)
+        if any(not p.endswith('.' + format) for p in paths):
+            raise ValueError(f'{folder} already holds shards of another format')
+
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.format = format
+        self.rows = rows
+        self.mechs = None
+        self.next = len(paths)
+        self.buffer = []
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, row):
+        if self.mechs is None:
+            self.mechs = len(row['team'])
+        elif len(row['team']) != self.mechs:
+            raise ValueError('every battle in a folder needs the same number of mechs')
+
+        self.buffer.append(row)
+        if len(self.buffer) >= self.rows:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        path = os.path.join(self.folder, f'{self.next:05}.{self.format}')
+        # written whole and renamed into place, so readers never see half a shard
+        if self.format == 'npy':
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, self.array(self.buffer))
+        else:
+            with open(path + '.tmp', 'w', newline='') as f:
+                self.csv(f, self.buffer)
+        os.replace(path + '.tmp', path)
+
+        self.next += 1
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def array(self, rows):
+        dtype = [*SCALARS, *((name, kind, (self.mechs,)) for name, kind in PER_MECH)]
+        return np.array([
+            tuple(row[name] for name, *_ in dtype) for row in rows], dtype=dtype)
+
+    def csv(self, f, rows):
+        writer = csv.writer(f)
+        writer.writerow(columns(self.mechs))
+        for row in rows:
+            writer.writerow([*(row[name] for name, _ in SCALARS),
+                *(row[name][i] for i in range(self.mechs) for name, _ in PER_MECH)])
+
+
+def columns(mechs):
+    # CSV header, per mech columns are suffixed with the mech's index
+    return [*(name for name, _ in SCALARS),
+        *(f'{name}{i}' for i in range(mechs) for name, _ in PER_MECH)]
+
+
+def export(rows, folder, format='npy', shard_rows=SHARD_ROWS):
+    # write a stream of rows, returns how many there were
+    with Shards(folder, format, shard_rows) as shards:
+        for row in rows:
+            shards.write(row)
+    return shards.written
+
+
+# ------------ reading ---------------
+
+def shards(folder):
+    # every .npy shard, memory-mapped, oldest first
+    for path in shard_paths(folder):
+        if not path.endswith('.npy'):
+            raise ValueError(f'{path} is not a .npy shard')
+        yield np.load(path, mmap_mode='r')
+
+
+def read(folder):
+    # rows as summarize() makes them, one shard in memory at a time
+    for path in shard_paths(folder):
+        if path.endswith('.npy'):
+            array = np.load(path, mmap_mode='r')
+            for record in array:
+                yield {name: record[name].item() if name in dict(SCALARS)
+                    else tuple(record[name].tolist()) for name in array.dtype.names}
+        else:
+            with open(path, newline='') as f:
+                reader = csv.reader(f)
+                mechs = (len(next(reader)) - len(SCALARS)) // len(PER_MECH)
+                for values in reader:
+                    values = list(map(int, values))
+                    row = dict(zip((name for name, _ in SCALARS), values))
+                    for j, (name, _) in enumerate(PER_MECH):
+                        row[name] = tuple(values[len(SCALARS) + i*len(PER_MECH) + j]
+                            for i in range(mechs))
+                    yield row
+
+
+def summary(folder):
+    # battles, draws and mean actions, without loading the folder
+    total = draws = actions = 0
+    paths = shard_paths(folder)
+    if paths and paths[0].endswith('.npy'):
+        for array in shards(folder):
+            total += len(array)
+            draws += int((array['winner'] == -1).sum())
+            actions += int(array['actions'].sum())
+    else:
+        for row in read(folder):
+            total += 1
+            draws += row['winner'] == -1
+            actions += row['actions']
+    return total, draws, actions / total if total else 0.0
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('folder', help='results folder, shards are added to it')
+    parser.add_argument('--show', action='store_true',
+        help='summarize the folder and stop')
+    parser.add_argument('--battles', type=int, default=1000,
+        help='battles per pairing of loadouts, in each seat order')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=FORMATS,
+        default='npy' if np is not None else 'csv')
+    parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS)
+    args = parser.parse_args(argv)
+
+    if not args.show:
+        def pairings():
+            for first, a in loadouts.LOADOUTS.items():
+                for second, b in loadouts.LOADOUTS.items():
+                    if first == second:
+                        continue
+                    seeds = (split_seed(args.seed, f'{first}/{second}/{i}')
+                        for i in range(args.battles))
+                    yield from battles(lambda: [
+                        loadouts.build(first, a, 'first'),
+                        loadouts.build(second, b, 'second'),
+                    ], seeds)
+
+        export(pairings(), args.folder, args.format, args.shard_rows)
+
+    total, draws, actions = summary(args.folder)
+    print(f'{total} battles, {draws} draws, {actions:.1f} actions on average')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
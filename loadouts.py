@@ -0,0 +1,51 @@
+"""
+Named card lists for GMS_Everest.equip, shared by tests and tools.
+"""
+from main import *
+
+
+BIG_TUMPO = [
+    AblativeArmor,
+    GMSCore,
+    FragGrenade,
+
+    ArmorPlating,
+    HeavyPlating,
+    HeavyPlating,
+
+    Overswing,
+    Overswing,
+    Bonk,
+    Bonk,
+    Bonk,
+    ReinforcedActuators,
+]
+
+LIL_UZI = [
+    GMSCore,
+    FuelInjectors,
+    AblativeArmor,
+
+    ShootPistol,
+    ShootPistol,
+    Reload,
+
+    Snipe,
+    Snipe,
+    BurstFire,
+    BurstFire,
+    BurstFire,
+    Reload,
+]
+
+LOADOUTS = {
+    'BigTumpo': BIG_TUMPO,
+    'LilUzi': LIL_UZI,
+}
+
+
+def build(name, cards, team):
+    mech = GMS_Everest(name=name)
+    mech.equip(*cards)
+    mech.team = team
+    return mech
@@ -0,0 +1,309 @@
+"""
+Lockstep engine, plays N copies of a 1v1 matchup at once as NumPy arrays.
+
+Hands, hand stat sums, stress, heat and deck positions each get one row
+per battle, and every attack is resolved for all the battles that play
+it on the same step. Decks are never shuffled, so each mech's deck is a
+single row of card ids shared by every battle.
+
+Results have no action count, since this engine has no pending actions
+to count, so BattleResult.actions is None. Battles are capped in turns
+instead, and those end with REASON_MAX_TURNS.
+
+Needs NumPy, which the rest of the game does not.
+"""
+import copy
+
+from fractions import Fraction
+from collections import Counter
+
+import numpy as np
+
+from main import *
+
+
+BIAS, HULL, AGI, CPU = range(4)
+
+def card_attacks(kind):
+    # (start phase, attack skill, defense skill, reach, melee, damage, piercing)
+    # per attack, in the order the card makes them, from the card definition
+    phase = PHASE_ROLL_ACCURACY if issubclass(kind, VolleyCard) else PHASE_CHOOSE_TARGET
+    return [(phase, attack_skill, defense_skill, reach, reach.melee, damage, piercing)
+        for reach, attack_skill, defense_skill, damage, piercing in kind.attacks]
+
+
+ATTACKS = {
+    **{kind: card_attacks(kind) for kind in CARDS.values()
+        if issubclass(kind, AttackCard)},
+    FragGrenade: [
+        (PHASE_SOLID_HIT, Stats(), Stats(), FragGrenade.range, False, 1, False)],
+}
+
+# cards with a play effect that is not an attack, everything else
+# in the pool only gets discarded when played
+SPECIAL = FuelInjectors, EmergencyCoolant
+
+# a turn cap, not BattleManager's action cap
+REASON_MAX_TURNS = 'max turns'
+
+# integer codes for BattleResult.reason
+REASONS = REASON_ELIMINATED, REASON_OUT_OF_CARDS, REASON_MAX_TURNS
+
+MAX_TURNS = 1_000
+
+
+def as_vector(stats):
+    return np.array([stats.bias, stats.hull, stats.agi, stats.cpu])
+
+
+class LockstepBattles:
+    def __init__(self, mech, other, battles, seed=None):
+        assert mech.team != other.team
+        self.mechs = [mech, other]
+        self.n = battles
+        self.rng = np.random.default_rng(seed)
+
+        for kind in {type(c) for m in self.mechs for c in m.deck}:
+            if kind.play is not Card.play and kind not in (*ATTACKS, *SPECIAL):
+                raise ValueError(f'no lockstep rules for {kind.__name__}')
+
+        # card id -> card type, id -1 is an empty slot
+        self.types = sorted(
+            {type(c) for m in self.mechs for c in m.deck},
+            key=lambda t: t.__name__)
+        self.ids = {t: i for i, t in enumerate(self.types)}
+
+        # the last row doubles as the stats of an empty slot
+        self.card_stats = np.zeros((len(self.types) + 1, 4), dtype=np.int64)
+        for t, i in self.ids.items():
+            self.card_stats[i] = as_vector(t.stats)
+
+        # card ids in the order each mech draws them
+        self.deck_size = np.array([len(m.deck) for m in self.mechs])
+        self.decks = np.full((2, self.deck_size.max()), -1)
+        for m, mech in enumerate(self.mechs):
+            order = [self.ids[type(c)] for c in reversed(mech.deck)]
+            self.decks[m, :len(order)] = order
+
+        self.handsize = np.array([m.handsize for m in self.mechs])
+        self.limit = np.array([m.reactorLimit * HALF_POINTS for m in self.mechs])
+        self.gauge = np.array([m.heat_gauge for m in self.mechs])
+
+        # both mechs are alone on their side, so they count as both lines
+        self.distance = line_distance(False, True, True, True, True)
+
+        n, width = battles, self.handsize.max()
+        self.hand = np.full((n, 2, width), -1)   # oldest card first
+        self.size = np.zeros((n, 2), dtype=np.int64)
+        self.drawn = np.zeros((n, 2), dtype=np.int64)
+        self.stats = np.zeros((n, 2, 4), dtype=np.int64)
+        self.half_stress = np.tile(
+            [m.half_stress for m in self.mechs], (n, 1))
+        self.heat = np.tile([m.heat for m in self.mechs], (n, 1))
+
+        self.done = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -1)    # mech index, -1 for a draw
+        self.reason = np.full(n, -1)    # index into REASONS
+        self.turns = np.zeros(n, dtype=np.int64)
+
+    # ------------ hands ---------------
+
+    def count(self, rows, mech, kind):
+        if kind not in self.ids:
+            return np.zeros(len(rows), dtype=np.int64)
+        return (self.hand[rows, mech] == self.ids[kind]).sum(-1)
+
+    def draw(self, rows, mech):
+        card = self.decks[mech, self.drawn[rows, mech]]
+        self.hand[rows, mech, self.size[rows, mech]] = card
+        self.stats[rows, mech] += self.card_stats[card]
+        self.size[rows, mech] += 1
+        self.drawn[rows, mech] += 1
+
+    def discard_oldest(self, rows, mech):
+        card = self.hand[rows, mech, 0]
+        self.hand[rows, mech, :-1] = self.hand[rows, mech, 1:]
+        self.hand[rows, mech, -1] = -1
+        self.stats[rows, mech] -= self.card_stats[card]
+        self.size[rows, mech] -= 1
+
+    def scrap_all(self, rows, mech, kind):
+        hand = self.hand[rows, mech]
+        scrapped = hand == self.ids[kind]
+        hand = np.take_along_axis(hand,
+            np.argsort(scrapped, axis=-1, kind='stable'), -1)
+
+        removed = scrapped.sum(-1)
+        self.size[rows, mech] -= removed
+        hand[np.arange(hand.shape[1]) >= self.size[rows, mech][:, None]] = -1
+        self.hand[rows, mech] = hand
+        self.stats[rows, mech] -= removed[:, None] * self.card_stats[self.ids[kind]]
+
+    # ------------ turns ---------------
+
+    def run(self, max_turns=MAX_TURNS):
+        for _ in range(max_turns):
+            if self.done.all():
+                break
+            self.step()
+
+        over = ~self.done
+        self.reason[over] = REASONS.index(REASON_MAX_TURNS)
+        self.done[over] = True
+        return self
+
+    def step(self):
+        live = ~self.done
+        self.turns[live] += 1
+
+        full = (self.size == self.handsize) & live[:, None]
+        acting = full.any(1)
+
+        actor = np.where(full[:, 0], 0, 1)
+        both = np.flatnonzero(full.all(1))
+        actor[both] = self.rng.integers(0, 2, len(both))
+
+        rows = np.flatnonzero(acting)
+        self.play(rows, actor[rows])
+        self.draw_all(np.flatnonzero(live & ~acting))
+
+    def draw_all(self, rows):
+        stocked = (self.drawn[rows] < self.deck_size).all(1)
+
+        out = rows[~stocked]
+        self.done[out] = True
+        self.reason[out] = REASONS.index(REASON_OUT_OF_CARDS)
+
+        rows = rows[stocked]
+        for mech in 0, 1:
+            self.draw(rows, np.full(len(rows), mech))
+
+    def play(self, rows, actor):
+        card = self.hand[rows, actor, 0]
+
+        for kind, i in self.ids.items():
+            picked = card == i
+            if not picked.any():
+                continue
+            these, mech = rows[picked], actor[picked]
+
+            for attack in ATTACKS.get(kind, ()):
+                live = ~self.done[these]
+                these, mech = these[live], mech[live]
+                self.attack(these, mech, *attack)
+
+            live = ~self.done[these]
+            these, mech = these[live], mech[live]
+
+            if kind is EmergencyCoolant:
+                hot = np.flatnonzero(self.heat[these, mech] >= self.gauge[mech])
+                self.heat[these[hot], mech[hot]] -= self.gauge[mech[hot]]
+
+            self.discard_oldest(these, mech)
+
+            if kind is FuelInjectors:
+                stocked = self.drawn[these, mech] < self.deck_size[mech]
+                self.draw(these[stocked], mech[stocked])
+
+    # ------------ attacks ---------------
+
+    def attack(self, rows, source, phase, attack_skill, defense_skill,
+            reach, melee, damage, piercing):
+        if not reach.covers(self.distance) or not len(rows):
+            return  # nothing in range, the attack fizzles
+
+        target = 1 - source
+        attack_skill = as_vector(attack_skill)
+        defense_skill = as_vector(defense_skill)
+
+        if phase == PHASE_SOLID_HIT:
+            solid = np.ones(len(rows), dtype=bool)
+            miss = ~solid
+        else:
+            offense = self.stats[rows, source] @ attack_skill
+            defense = self.stats[rows, target] @ defense_skill
+            if defense_skill[CPU]:
+                defense += (defense_skill[CPU] *
+                    self.count(rows, target, GMSProcessor))
+
+            solid = offense > defense
+            miss = offense < defense
+
+            if defense_skill[AGI]:
+                dodged = miss & (offense - defense <= 3*defense_skill[AGI])
+                self.heat[rows, target] += np.where(dodged,
+                    2 * self.count(rows, target, JetBoost), 0)
+
+        hit = np.full(len(rows), damage)
+        if melee:
+            hit += np.where(solid, self.count(rows, source, ReinforcedActuators), 0)
+        hit = np.where(solid, hit * HALF_POINTS, hit)
+
+        # piercing damage goes through hull untouched
+        reactor = hit if piercing else hit - self.stats[rows, target, HULL]
+        landed = ~miss & (reactor > 0)
+
+        rows, source, target, reactor = (
+            rows[landed], source[landed], target[landed], reactor[landed])
+
+        armor = self.count(rows, target, AblativeArmor)
+        if armor.any():
+            reactor = np.where(armor > 0,
+                np.maximum(0, reactor - 2*HALF_POINTS*armor), reactor)
+            self.scrap_all(rows, target, AblativeArmor)
+
+        self.half_stress[rows, target] += reactor
+
+        melted = self.half_stress[rows, target] > self.limit[target]
+        self.done[rows[melted]] = True
+        self.winner[rows[melted]] = source[melted]
+        self.reason[rows[melted]] = REASONS.index(REASON_ELIMINATED)
+
+    # ------------ results ---------------
+
+    def results(self):
+        teams = [m.team for m in self.mechs]
+        for i in range(self.n):
+            yield BattleResult(
+                winner=None if self.winner[i] < 0 else teams[self.winner[i]],
+                actions=None,
+                stress=tuple(Fraction(int(s), HALF_POINTS) for s in self.half_stress[i]),
+                heat=tuple(int(h) for h in self.heat[i]),
+                reason=REASONS[self.reason[i]],
+            )
+
+
+def distribution(values):
+    values = list(values)
+    counts = Counter(values)
+    return {v: c / len(values) for v, c in counts.items()}
+
+
+def total_variation(p, q):
+    return sum(abs(p.get(k, 0) - q.get(k, 0)) for k in p.keys() | q.keys()) / 2
+
+
+def validate(mech, other, battles=1000, seed=0):
+    """
+    Play the same matchup on BattleManager and on LockstepBattles,
+    and compare the outcome distributions. Returns the total variation
+    distance for the winner, the end reason, and each mech's stress and heat.
+    """
+    reference = []
+    for i in range(battles):
+        mechs = copy.deepcopy([mech, other])
+        reference.append(BattleManager(mechs, seed=split_seed(seed, i)).simulate())
+
+    lockstep = list(LockstepBattles(mech, other, battles, seed=seed).run().results())
+
+    report = {}
+    for name, value in (
+        ('winner', lambda r: r.winner),
+        ('reason', lambda r: r.reason),
+        ('stress', lambda r: r.stress),
+        ('heat', lambda r: r.heat),
+    ):
+        report[name] = total_variation(
+            distribution(map(value, reference)),
+            distribution(map(value, lockstep)))
+    return report
@@ -1,51 +1,103 @@
+import os
+import re
+import json
+import time
+import pickle
 import random
 import types
+import hashlib
 
+from bisect import insort
+from operator import attrgetter
 from fractions import Fraction
-from collections import deque
+from collections import deque, Counter
 
 
 class Stats:
+    """
+    Immutable, so cards and mechs can share instances.
+    """
+    __slots__ = 'bias', 'hull', 'agi', 'cpu'
+
+    # string -> Stats, see parse
+    _parsed = {}
+
     def __init__(self, bias=0, hull=0, agi=0, cpu=0):
-        self.bias = bias
-        self.hull = hull
-        self.agi = agi
-        self.cpu = cpu
+        init = object.__setattr__
+        init(self, 'bias', bias)
+        init(self, 'hull', hull)
+        init(self, 'agi', agi)
+        init(self, 'cpu', cpu)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Stats are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Stats are immutable')
     
     @classmethod
     def parse(cls, string):
-        stats = cls()
+        # cards parse the same few strings on every play
+        if (stats := cls._parsed.get(string)) is None:
+            stats = cls._parsed[string] = cls._parse(string)
+        return stats
+
+    @classmethod
+    def _parse(cls, string):
+        fields = dict(bias=0, hull=0, agi=0, cpu=0)
 
         for token in string.lower().split():
-            total = (
-                {'-':-1, '+':+1}[token[0]] *    # sign times
-                (1, m := token[1])[m.isdigit()] # magnitude
-            )
+            sign = {'-':-1, '+':+1}[token[0]]
+            digits = token[1:].rstrip('hulagicp')
+            name = token[1+len(digits):] or 'bias'
 
-            for field in 'hull', 'agi', 'cpu':
-                if token.endswith(field):
-                    stats.__dict__[field] += int(total)
-                    break
-            else:
-                stats.bias += int(total)
+            fields[name] += sign * int(digits or 1)
 
-        return stats
+        return cls(**fields)
     
     def dotProduct(self, other):
-        return sum((
-            self.bias * other.bias,
-            self.hull * other.hull,
-            self.agi * other.agi,
-            self.cpu * other.cpu,
-        ))
+        return (
+            self.bias * other.bias +
+            self.hull * other.hull +
+            self.agi * other.agi +
+            self.cpu * other.cpu)
     
     def __add__(self, other):
         return Stats(
-            self.bias + other.bias,
-            self.hull + other.hull,
-            self.cpu + other.cpu,
-            self.agi + other.agi,
+            bias=self.bias + other.bias,
+            hull=self.hull + other.hull,
+            agi=self.agi + other.agi,
+            cpu=self.cpu + other.cpu,
+        )
+
+    def __sub__(self, other):
+        return Stats(
+            bias=self.bias - other.bias,
+            hull=self.hull - other.hull,
+            agi=self.agi - other.agi,
+            cpu=self.cpu - other.cpu,
         )
+
+    def __eq__(self, other):
+        if not isinstance(other, Stats):
+            return NotImplemented
+        return (
+            self.bias == other.bias and
+            self.hull == other.hull and
+            self.agi == other.agi and
+            self.cpu == other.cpu)
+
+    def __hash__(self):
+        return hash((self.bias, self.hull, self.agi, self.cpu))
+
+    def __reduce__(self):
+        return Stats, (self.bias, self.hull, self.agi, self.cpu)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
     
     def __repr__(self):
         return f'STATS :: {self.bias} +{self.agi}agi +{self.hull}hull +{self.cpu}cpu'
@@ -64,18 +116,53 @@ class EffectRange:
         self.mid = mid
         self.long = long
 
+        # bit N is set if the range covers distance N
+        self.mask = (
+            (melee or close) << CLOSE_RANGE |
+            mid << MID_RANGE |
+            long << LONG_RANGE)
+
     def covers(self, distance):
-        return {
-            0: self.melee or self.close,
-            1: self.mid,
-            2: self.long,
-        }[distance]
+        return bool(self.mask >> distance & 1)
+
+
+def line_distance(same_team, frontline, backline, other_frontline, other_backline):
+    if same_team:
+        samespot = any((
+                frontline == other_frontline,
+                backline == other_backline,
+        ))
+
+        if samespot:
+            return CLOSE_RANGE
+        else:
+            return MID_RANGE
+    
+    if frontline and other_frontline:
+        return CLOSE_RANGE
+
+    elif ((frontline and other_backline) or
+          (backline and other_frontline)):
+        return MID_RANGE
+    
+    else:
+        return LONG_RANGE
+
+
+# who a reaction cares about, relative to the card's own mech
+TRIGGER_TARGET = 0
+TRIGGER_SOURCE = 1
+TRIGGER_ANY = 2
 
 
 class Card:
     stats = Stats()
     scrapped = False
 
+    # (action type, phase, TRIGGER_*) for every action this card
+    # could react to, canReactTo still makes the final call
+    triggers = ()
+
     def __init__(self, mech):
         self.mech = mech
 
@@ -88,24 +175,63 @@ class Card:
         pass
     
     def canReactTo(self, gamestate):
+        # cached until the top of the queue, its phase or a hand changes,
+        # see BattleManager.getPossibleReactions
         return False
     
     def discard_me(self, gamestate):
-        print(self in self.mech.hand)
-        self.mech.hand.remove(self)
+        self.mech.remove_from_hand(self)
+        if gamestate.log is not None:
+            gamestate.log.append(
+                (type(self), EVENT_DISCARDED, self.mech.index, None, None))
     
-    def scrap_me(self):
+    def scrap_me(self, gamestate=None):
+        if self in self.mech.hand:
+            self.mech.remove_from_hand(self)
+        if gamestate is not None and gamestate.log is not None:
+            gamestate.log.append(
+                (type(self), EVENT_SCRAPPED, self.mech.index, None, None))
+
+        # out of the hand for good, so it can't be played or react again
         self.scrapped = True
-        self.play =           lambda g: None
-        self.playReactively = lambda g: None
-        self.canReactTo =     lambda g: False
+
+
+class Pilot:
+    """
+    Makes a mech's decisions. This one plays the oldest card in hand,
+    and leaves targets and reactions to chance.
+    """
+    def choose_card(self, gamestate, mech):
+        return mech.hand[-1]
+
+    def choose_target(self, gamestate, attack, valid):
+        return gamestate.random.choice(valid)
+
+    def choose_reaction(self, gamestate, possible):
+        return gamestate.random.choice(possible)
+
+DEFAULT_PILOT = Pilot()
+
+# what a pilot decided, stored in the low bits of a decision,
+# the index of the choice among the options goes above them
+DECISION_CARD = 0
+DECISION_TARGET = 1
+DECISION_REACTION = 2
+DECISION_BITS = 2
+
+
+# damage and reactor stress are tracked in integer half points,
+# a grazing hit or a point of hull is worth one of them
+HALF_POINTS = 2
 
 
 class BattleMech:
+    # check the running stats total against a full recompute on every read
+    debug_stats = False
 
     def __init__(self, handsize, 
         stress=0, reactorLimit=6, heat=0, heat_gauge=6,
-        team=None, frontline=True, backline=True, deck=None):
+        team=None, frontline=True, backline=True, deck=None, pilot=None):
 
         self.handsize = handsize
         self.stress = stress
@@ -118,62 +244,414 @@ class BattleMech:
         self.frontline = frontline
         self.backline = backline
 
+        self.pilot = pilot or DEFAULT_PILOT
+
         self.deck = deck or []
         self.hand = deque()
         self.discard = []
+
+        # running total of the stats of every card in hand
+        self._stats = Stats()
+
+        # set by BattleManager, keeps its reaction index in sync
+        self.battle = None
+        self.index = None
+        self.melted = False
     
 
     def distanceTo(self, other):
-        if sameTeam := self.team == other.team:
-            samespot = any((
-                    self.frontline == other.frontline,
-                    self.backline == other.backline,
-            ))
-
-            if samespot:
-                return CLOSE_RANGE
-            else:
-                return MID_RANGE
-        
-        if self.frontline and other.frontline:
-            return CLOSE_RANGE
-
-        elif ((self.frontline and other.backline) or
-              (self.backline and other.frontline)):
-            return MID_RANGE
-        
-        else:
-            return LONG_RANGE
+        return line_distance(self.team == other.team,
+            self.frontline, self.backline,
+            other.frontline, other.backline)
     
+    def add_to_hand(self, card):
+        self.hand.appendleft(card)
+        self._stats += card.stats
+        if self.battle:
+            self.battle.hands_version += 1
+            self.battle.update_ready(self)
+            if card.triggers:
+                self.battle.index_reactions(card)
+
+    def remove_from_hand(self, card):
+        self.hand.remove(card)
+        self._stats -= card.stats
+        if self.battle:
+            self.battle.hands_version += 1
+            self.battle.update_ready(self)
+            if card.triggers:
+                self.battle.unindex_reactions(card)
+
+    def recompute_stats(self):
+        total = Stats()
+        for card in self.hand:
+            total += card.stats
+        return total
+
+    @property
+    def stress(self):
+        return Fraction(self.half_stress, HALF_POINTS)
+
+    @stress.setter
+    def stress(self, value):
+        self.half_stress = int(value * HALF_POINTS)
+
+    def over_limit(self):
+        return self.half_stress > self.reactorLimit * HALF_POINTS
+
+    def save(self):
+        return (self.half_stress, self.heat, self.melted,
+            self.frontline, self.backline, self._stats,
+            tuple(self.hand), tuple(self.deck), tuple(self.discard))
+
+    def load(self, state):
+        (self.half_stress, self.heat, self.melted,
+            self.frontline, self.backline, self._stats,
+            hand, deck, discard) = state
+
+        self.hand.clear()
+        self.hand.extend(hand)
+        self.deck[:] = deck
+        self.discard[:] = discard
+
     @property
     def stats(self):
-        # sum of stats for (each card in hand)
-        return sum([card.stats for card in self.hand], 
-            start=Stats())
+        if self.debug_stats:
+            assert self._stats == self.recompute_stats(), self
+        return self._stats
     
 
+def split_seed(seed, index):
+    # independent, reproducible seed for the index-th battle of a sweep
+    digest = hashlib.sha256(f'{seed}/{index}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+# why a battle ended, see BattleResult
+REASON_ELIMINATED = 'eliminated'
+REASON_OUT_OF_CARDS = 'out of cards'
+REASON_MAX_ACTIONS = 'max actions'
+
+MAX_ACTIONS = 10_000
+
+
+class BattleResult:
+    def __init__(self, winner, actions, stress, heat, reason):
+        self.winner = winner    # team name, or None for a draw
+        self.actions = actions
+        self.stress = stress    # per mech, in BattleManager.mechs order
+        self.heat = heat
+        self.reason = reason
+
+    def __repr__(self):
+        return f'RESULT :: {self.winner} after {self.actions} actions ({self.reason})'
+
+
+class BattleSnapshot:
+    __slots__ = ('mechs', 'scrapped', 'pending', 'random', 'reacted', 'active',
+        'lanes', 'lane_of', 'target_lists', 'actions', 'result', 'log', 'decisions')
+
+    def __init__(self, **state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class Profile:
+    """
+    Counters per (action type, phase), filled in by BattleManager.execute
+    when the battle is made with profile=True. Reaction scans and the
+    reactions they find count towards the action on top of the queue.
+    """
+    FIELDS = ('calls', 'seconds', 'scan_seconds', 'max_depth',
+        'reactions', 'max_chain')
+
+    def __init__(self):
+        # (action type, phase) -> [value per FIELDS]
+        self.counters = {}
+
+    def entry(self, action):
+        # cards queue bound methods too, those count per method
+        kind = getattr(action, '__func__', None) or type(action)
+        key = kind, getattr(action, 'phase', None)
+        if (entry := self.counters.get(key)) is None:
+            entry = self.counters[key] = [0, 0.0, 0.0, 0, 0, 0]
+        return entry
+
+    def merge(self, other):
+        # add up another battle's counters, keeping the high-water marks
+        for key, theirs in other.counters.items():
+            ours = self.counters.setdefault(key, [0, 0.0, 0.0, 0, 0, 0])
+            for i, name in enumerate(self.FIELDS):
+                if name.startswith('max'):
+                    ours[i] = max(ours[i], theirs[i])
+                else:
+                    ours[i] += theirs[i]
+        return self
+
+    def rows(self):
+        # slowest first
+        def name(kind, phase):
+            return kind.__qualname__ + (f' :: {PHASE_NAMES[phase]}' if phase in PHASE_NAMES else '')
+
+        return [
+            {'action': name(*key), **dict(zip(self.FIELDS, entry))}
+            for key, entry in sorted(self.counters.items(),
+                key=lambda item: -item[1][1] - item[1][2])
+        ]
+
+    def table(self):
+        lines = [f'{"action":<40} {"calls":>8} {"ms":>9} {"scan ms":>9} '
+            f'{"depth":>5} {"reacts":>6} {"chain":>5}']
+        for row in self.rows():
+            lines.append(
+                f'{row["action"]:<40} {row["calls"]:>8} '
+                f'{1000*row["seconds"]:>9.2f} {1000*row["scan_seconds"]:>9.2f} '
+                f'{row["max_depth"]:>5} {row["reactions"]:>6} {row["max_chain"]:>5}')
+        return '\n'.join(lines)
+
+    def to_json(self):
+        return json.dumps(self.rows(), indent=2)
+
+
+# card events, stored in the phase slot of a log entry
+EVENT_PLAYED = -1
+EVENT_REACTED = -2
+EVENT_DISCARDED = -3
+EVENT_SCRAPPED = -4
+EVENT_MELTDOWN = -5
+
+
 class BattleManager:
-    def __init__(self, mechs):
+    def __init__(self, mechs, seed=None, record=False, profile=False,
+            decisions=False):
         assert len(set(m.team for m in mechs)) == 2
         self.mechs: types.List[BattleMech] = mechs
         self.pending = deque()  # todo: deque
-        self.log = []
+
+        # mechs that have not melted down yet
+        self.active = [m for m in mechs if not m.melted]
+
+        # (team, frontline, backline) lane -> [active mechs in it], and
+        # each mech's lane by index, rebuilt lazily after a move or a
+        # meltdown, see line_up
+        self.lanes = None
+        self.lane_of = None
+        # (lane, range mask) -> [active enemies in range]
+        self.target_lists = {}
+        self.actions = 0
+        self.max_actions = None
+        self.result = None
+
+        # (kind, phase, source index, target index, amount) per event,
+        # or None to skip recording entirely, see transcript()
+        self.log = [] if record else None
+
+        # every pilot decision as a small int, or None, see decide()
+        self.decisions = [] if decisions else None
+
+        # counters per action type, or None to run execute untimed
+        self.profile = Profile() if profile else None
+
+        # every card and action draws from this, never the global random
+        self.random = random.Random(seed)
+
+        # by mech index, searching pilots swap these out while they think
+        self.pilots = [m.pilot for m in mechs]
+
+        # every card in the battle, wherever it is, see snapshot
+        self.cards = [c for m in mechs for c in (*m.deck, *m.hand, *m.discard)]
+
+        # (action type, phase, TRIGGER_*, mech or None) -> [cards in hand]
+        self.reactions = {}
+        # (card, action, phase) reactions already played this execute
+        self.reacted = set()
+
+        # finished attacks, reused by AttackAction.new
+        self.spare_attacks = []
+
+        # card -> canReactTo, for the (action, phase, hands_version)
+        # in eligible_for, see getPossibleReactions
+        self.hands_version = 0
+        self.eligible = {}
+        self.eligible_for = None
+        self.eligible_hits = 0
+        self.eligible_misses = 0
+
+        for index, mech in enumerate(mechs):
+            mech.battle = self
+            mech.index = index
+            for card in mech.hand:
+                if card.triggers:
+                    self.index_reactions(card)
+
+        # indexes of the active mechs with full hands, in order, see turn
+        self.ready = [m.index for m in self.active if len(m.hand) == m.handsize]
 
     def set_seed(self, seed):
-        random.seed(seed)
+        self.random.seed(seed)
     
     def play(self):
-        while True:
-            can_act = [m for m in self.mechs if m.handsize == len(m.hand)]
-            if can_act:
-                mech = random.choice(can_act)
-                print(mech.name, 'plays standard action')
-                mech.hand[-1].play(self)
-            else:
-                print('queueing "everyone draws" actions')
-                self.then(DrawCardAction(m) for m in self.mechs)
-            self.execute()
+        return self.simulate(max_actions=None)
+
+    def simulate(self, max_actions=MAX_ACTIONS):
+        # play until a team is eliminated, someone runs out of cards,
+        # or max_actions actions have been executed
+        if max_actions is not None and max_actions < 1:
+            raise ValueError('max_actions must be at least 1, or None')
+        self.max_actions = max_actions
+
+        while self.result is None:
+            self.turn()
+
+        return self.result
+
+    def turn(self):
+        # one standard action, or everyone draws, then resolve it all
+        if self.ready:
+            mech = self.mechs[self.random.choice(self.ready)]
+            card = self.pilots[mech.index].choose_card(self, mech)
+            if self.decisions is not None:
+                self.decide(DECISION_CARD, mech.hand, card)
+            card.play(self)
+        elif all(m.deck for m in self.active):
+            self.then(DrawCardAction(m) for m in self.active)
+        else:
+            self.finish(None, REASON_OUT_OF_CARDS)
+        self.execute()
+
+    def snapshot(self):
+        # everything a turn can change, taken between turns
+        return BattleSnapshot(
+            mechs=tuple(m.save() for m in self.mechs),
+            scrapped=tuple(c for c in self.cards if c.scrapped),
+            pending=tuple(
+                (a, a.save() if hasattr(a, 'save') else None)
+                for a in self.pending),
+            random=self.random.getstate(),
+            reacted=frozenset(self.reacted),
+            active=tuple(self.active),
+            lanes=self.lanes,
+            lane_of=self.lane_of,
+            target_lists=dict(self.target_lists),
+            actions=self.actions,
+            result=self.result,
+            log=None if self.log is None else len(self.log),
+            decisions=None if self.decisions is None else len(self.decisions),
+        )
+
+    def restore(self, snapshot):
+        for mech, state in zip(self.mechs, snapshot.mechs):
+            mech.load(state)
+
+        for card in self.cards:
+            if card.scrapped:
+                card.scrapped = False
+        for card in snapshot.scrapped:
+            card.scrapped = True
+
+        self.pending.clear()
+        for action, state in snapshot.pending:
+            if state is not None:
+                action.load(state)
+            self.pending.append(action)
+
+        self.random.setstate(snapshot.random)
+        self.active[:] = snapshot.active
+        self.lanes = snapshot.lanes
+        self.lane_of = snapshot.lane_of
+        self.target_lists = dict(snapshot.target_lists)
+        self.ready = [m.index for m in self.active if len(m.hand) == m.handsize]
+        self.actions = snapshot.actions
+        self.result = snapshot.result
+        if self.log is not None:
+            del self.log[snapshot.log:]
+        if self.decisions is not None:
+            del self.decisions[snapshot.decisions:]
+        # a spare attack may be pending again in the restored queue
+        self.spare_attacks.clear()
+        self.forget_eligibility()
+
+        self.reactions.clear()
+        self.reacted = set(snapshot.reacted)
+        for mech in self.mechs:
+            for card in mech.hand:
+                if card.triggers:
+                    self.index_reactions(card)
+
+    def finish(self, winner, reason):
+        self.result = BattleResult(
+            winner=winner,
+            actions=self.actions,
+            stress=tuple(m.stress for m in self.mechs),
+            heat=tuple(m.heat for m in self.mechs),
+            reason=reason,
+        )
+
+    def meltdown(self, mech):
+        mech.melted = True
+        self.active.remove(mech)
+        self.update_ready(mech)
+        self.invalidate_positions()
+
+        teams = set(m.team for m in self.active)
+        if len(teams) < 2:
+            self.finish(teams.pop() if teams else None, REASON_ELIMINATED)
     
+    def move(self, mech, frontline, backline):
+        mech.frontline = frontline
+        mech.backline = backline
+        self.invalidate_positions()
+
+    def invalidate_positions(self):
+        self.lanes = None
+        self.target_lists.clear()
+        self.forget_eligibility()
+
+    def line_up(self):
+        # README: the last mech on a side counts as both frontline and backline
+        sizes = Counter(m.team for m in self.active)
+        self.lane_of = [
+            (m.team, True, True) if sizes[m.team] == 1 else
+            (m.team, m.frontline, m.backline)
+            for m in self.mechs
+        ]
+
+        self.lanes = {}
+        for m in self.active:
+            self.lanes.setdefault(self.lane_of[m.index], []).append(m)
+        return self.lanes
+
+    def distance(self, mech, other):
+        if self.lanes is None:
+            self.line_up()
+        team, *lane = self.lane_of[mech.index]
+        other_team, *other = self.lane_of[other.index]
+        return line_distance(team == other_team, *lane, *other)
+
+    def targets(self, source, range):
+        # shared between callers, copy before changing it
+        if self.lanes is None:
+            self.line_up()
+        key = self.lane_of[source.index], range.mask
+        if (valid := self.target_lists.get(key)) is None:
+            team, *lane = key[0]
+            # only the enemy lanes in range, then back in mech order
+            valid = self.target_lists[key] = sorted(
+                (m for (other_team, *other), mechs in self.lanes.items()
+                    if other_team != team and
+                    range.mask >> line_distance(False, *lane, *other) & 1
+                    for m in mechs),
+                key=attrgetter('index'))
+        return valid
+
+    def update_ready(self, mech):
+        # after a hand change or a meltdown, keeps ready in order
+        if len(mech.hand) == mech.handsize and not mech.melted:
+            if mech.index not in self.ready:
+                insort(self.ready, mech.index)
+        elif mech.index in self.ready:
+            self.ready.remove(mech.index)
+
     def then(self, *actions):
         if isinstance(actions[0], types.GeneratorType):
             actions = tuple(actions[0])
@@ -187,24 +665,165 @@ class BattleManager:
         self.pending.extendleft(actions)
     
     def execute(self):
-        while self.pending:
+        if self.profile is not None:
+            return self.execute_profiled()
+
+        while self.pending and self.result is None:
             if possible := self.getPossibleReactions():
-                print('reacting')
-                random.choice(possible).playReactively(self)
+                self.react(possible)
             else:
                 action = self.pending.pop()
-                self.log.append(action)
-                print('no reactions found, performing', action)
+                if self.log is not None and hasattr(action, 'event'):
+                    self.log.append(action.event())
                 action(self)
 
+                self.actions += 1
+                if (self.max_actions is not None and self.actions >= self.max_actions
+                        and self.result is None):
+                    self.finish(None, REASON_MAX_ACTIONS)
+        self.reacted.clear()
+
+    def execute_profiled(self):
+        # same as execute, with every step timed into self.profile,
+        # entries are indexed as in Profile.FIELDS
+        clock = time.perf_counter
+        chain, chained = 0, None
+
+        while self.pending and self.result is None:
+            action = self.pending[-1]
+            entry = self.profile.entry(action)
+
+            start = clock()
+            possible = self.getPossibleReactions()
+            entry[2] += clock() - start
+
+            if possible:
+                chain = chain + 1 if action is chained else 1
+                chained = action
+                entry[4] += 1
+                entry[5] = max(entry[5], chain)
+                self.react(possible)
+                continue
+
+            chained = None
+            entry[0] += 1
+            entry[3] = max(entry[3], len(self.pending))
+
+            self.pending.pop()
+            if self.log is not None and hasattr(action, 'event'):
+                self.log.append(action.event())
+            start = clock()
+            action(self)
+            entry[1] += clock() - start
+
+            self.actions += 1
+            if (self.max_actions is not None and self.actions >= self.max_actions
+                    and self.result is None):
+                self.finish(None, REASON_MAX_ACTIONS)
+        self.reacted.clear()
+
+    def react(self, possible):
+        # a pilot only chooses among its own mech's cards, other mechs
+        # are asked again once this reaction is done
+        mech = possible[0].mech
+        possible = [card for card in possible if card.mech is mech]
+        card = self.pilots[mech.index].choose_reaction(self, possible)
+        if self.decisions is not None:
+            self.decide(DECISION_REACTION, possible, card)
+        self.reacted.add(key := self.reaction_key(card))
+        if self.log is not None:
+            self.log.append((type(card), EVENT_REACTED, 
+                card.mech.index, None, key[2]))
+        card.playReactively(self)
+
+    def decide(self, kind, options, choice):
+        # which of the options, not the option itself, so it replays
+        self.decisions.append(options.index(choice) << DECISION_BITS | kind)
+
+    def transcript(self):
+        # human readable log, only formatted when someone asks
+        for event in self.log or ():
+            yield self.describe(*event)
+
+    def describe(self, kind, phase, source, target, amount):
+        name = lambda i: getattr(self.mechs[i], 'name', f'mech {i}')
+
+        if kind is DrawCardAction:
+            return f'{name(source)} draws a card'
+        if kind is AttackAction:
+            against = '' if target is None else f' vs {name(target)}'
+            damage = '' if amount is None else f' ({Fraction(amount, HALF_POINTS)})'
+            return f'{name(source)}{against} :: {PHASE_NAMES[phase]}{damage}'
+
+        card = kind.__name__
+        return {
+            EVENT_PLAYED: f'{name(source)} plays {card}',
+            EVENT_REACTED: f'{name(source)} reacts with {card}',
+            EVENT_DISCARDED: f'{name(source)} discards {card}',
+            EVENT_SCRAPPED: f'{name(source)} scraps {card}',
+            EVENT_MELTDOWN: f'{name(source)} goes kaBOOM! ({Fraction(amount or 0, HALF_POINTS)} stress)',
+        }[phase]
+
+    def trigger_keys(self, card):
+        for kind, phase, who in card.triggers:
+            mech = None if who == TRIGGER_ANY else card.mech
+            yield kind, phase, who, mech
+
+    def index_reactions(self, card):
+        for key in self.trigger_keys(card):
+            self.reactions.setdefault(key, []).append(card)
+
+    def unindex_reactions(self, card):
+        for key in self.trigger_keys(card):
+            self.reactions[key].remove(card)
+
+    def reaction_key(self, card):
+        action = self.pending[-1]
+        return card, action, getattr(action, 'phase', None)
+
     def getPossibleReactions(self):
+        if not self.reactions:
+            return []
+
+        action = self.pending[-1]
+        kind = type(action)
+        phase = getattr(action, 'phase', None)
+
+        # after a reaction the same action is checked again, so keep
+        # each card's answer until the action, its phase or a hand changes
+        if (action, phase, self.hands_version) != self.eligible_for:
+            self.eligible_for = action, phase, self.hands_version
+            self.eligible.clear()
+        eligible = self.eligible
+
         r = []
-        for mech in self.mechs:
-            for card in mech.hand:
-                if card.canReactTo(self):
+        for key in (
+            (kind, phase, TRIGGER_TARGET, getattr(action, 'target', None)),
+            (kind, phase, TRIGGER_SOURCE, getattr(action, 'source', None)),
+            (kind, phase, TRIGGER_ANY, None),
+        ):
+            for card in self.reactions.get(key, ()):
+                if (card, action, phase) in self.reacted:
+                    continue
+                if (ok := eligible.get(card)) is None:
+                    ok = eligible[card] = card.canReactTo(self)
+                    self.eligible_misses += 1
+                else:
+                    self.eligible_hits += 1
+                if ok:
                     r.append(card)
         return r
 
+    def forget_eligibility(self):
+        # for anything that changes what canReactTo would say, other than
+        # the top of the queue, its phase or a hand
+        self.eligible_for = None
+
+    @property
+    def eligible_hit_rate(self):
+        checks = self.eligible_hits + self.eligible_misses
+        return self.eligible_hits / checks if checks else 0.0
+
 
 # ------------ Actions ---------------
 
@@ -213,17 +832,21 @@ class DrawCardAction:
         self.mech: BattleMech = mech
     
     def __call__(self, gamestate):
-        card = self.mech.deck.pop()
-        self.mech.hand.appendleft(card)
+        if self.mech.deck:  # FuelInjectors can ask for one too many
+            self.mech.add_to_hand(self.mech.deck.pop())
+
+    def event(self):
+        return DrawCardAction, None, self.mech.index, None, None
 
 class CardPlayedAction:
     def __init__(self, card):
         self.card = card
 
     def __call__(self, gamestate):
-        name = self.card.__class__.__name__
-        gamestate.log.append(
-            f'{self.card.mech} plays {name}')
+        pass  # only here to show up in the log
+
+    def event(self):
+        return type(self.card), EVENT_PLAYED, self.card.mech.index, None, None
     
     def __str__(self):
         name = self.card.__class__.__name__
@@ -238,12 +861,31 @@ PHASE_MISSED_ATTACK = 4
 PHASE_APPLY_ARMOR_REDUCTION = 5
 PHASE_DEAL_REACTOR_STRESS = 6
 
+PHASE_NAMES = {
+    PHASE_CHOOSE_TARGET: 'Choosing Target',
+    PHASE_ROLL_ACCURACY: 'Rolling Accuracy',
+    PHASE_SOLID_HIT: "Solid Hit",
+    PHASE_GRAZING_HIT: "Grazing Hit",
+    PHASE_MISSED_ATTACK: "Missed Attack",
+    PHASE_APPLY_ARMOR_REDUCTION: 'Applying Armor Reduction',
+    PHASE_DEAL_REACTOR_STRESS: 'Dealing Reactor Stress'
+}
+
 class AttackAction:
+    """
+    One attack, requeued once per phase so reactions can step in between.
+    Finished attacks go back to their battle's spare_attacks, see new().
+    """
+    __slots__ = ('phase', 'source', 'target', 'offense', 'defense',
+        'attack_skill', 'defense_skill', 'range', 'piercing',
+        'initial_damage', 'hit_damage', 'reactor_damage', 'defense_bonus')
+
     def __init__(self, 
         phase, source, target=None, offense=0, defense=0,
         attack_skill=Stats(), defense_skill=Stats(), 
         range=None, piercing=False, 
-        initial_damage=0, hit_damage=0, reactor_damage=0):
+        initial_damage=0, hit_damage=0, reactor_damage=0,
+        defense_bonus=0):
         self.phase = phase
         self.source = source
         self.target = target
@@ -253,103 +895,321 @@ class AttackAction:
         self.defense_skill = defense_skill
         self.range = range
         self.piercing = piercing
+        # initial_damage is in whole points, as printed on the card,
+        # hit_damage and reactor_damage are in half points
         self.initial_damage = initial_damage
         self.hit_damage = hit_damage
         self.reactor_damage = reactor_damage
+        self.defense_bonus = defense_bonus
+
+    @classmethod
+    def new(cls, gamestate, *args, **kwargs):
+        # a finished attack from this battle if there is one, else a new one
+        if gamestate.spare_attacks:
+            attack = gamestate.spare_attacks.pop()
+            attack.__init__(*args, **kwargs)
+            return attack
+        return cls(*args, **kwargs)
         
+    def save(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def load(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
     def __call__(self, gamestate):
-        {
-            PHASE_CHOOSE_TARGET: self.choose_target,
-            PHASE_ROLL_ACCURACY: self.roll_accuracy,
-            PHASE_SOLID_HIT: self.solid_hit,
-            PHASE_GRAZING_HIT: self.grazing_hit,
-            PHASE_MISSED_ATTACK: self.missed_attack,
-            PHASE_APPLY_ARMOR_REDUCTION: self.apply_armor_reduction,
-            PHASE_DEAL_REACTOR_STRESS: self.deal_reactor_stress,
-        }[self.phase](gamestate)
+        if (phase := self.steps[self.phase](self, gamestate)) is None:
+            gamestate.spare_attacks.append(self)
+        else:
+            self.phase = phase
+            gamestate.pending.append(self)
+
+    # one step per phase, each returns the next phase,
+    # or None once the attack is over
     
     def choose_target(self, gamestate):
-        valid = [m for m in gamestate.mechs if
-            m.team != self.source.team and 
-            self.range.covers(self.source.distanceTo(m))]
-        
-        self.target = random.choice(valid)
-        self.phase = PHASE_ROLL_ACCURACY
-        gamestate.then(self)
+        valid = gamestate.targets(self.source, self.range)
+        if not valid:
+            return None  # nothing in range, the attack fizzles
+
+        pilot = gamestate.pilots[self.source.index]
+        self.target = pilot.choose_target(gamestate, self, valid)
+        if gamestate.decisions is not None:
+            gamestate.decide(DECISION_TARGET, valid, self.target)
+        return PHASE_ROLL_ACCURACY
 
     def roll_accuracy(self, gamestate):
         self.offense = self.attack_skill.dotProduct(self.source.stats)
-        self.defense = self.defense_skill.dotProduct(self.target.stats)
+        self.defense = (self.defense_bonus + 
+            self.defense_skill.dotProduct(self.target.stats))
 
         if self.offense > self.defense:
-            self.phase = PHASE_SOLID_HIT
+            return PHASE_SOLID_HIT
         elif self.offense < self.defense:
-            self.phase = PHASE_MISSED_ATTACK
+            return PHASE_MISSED_ATTACK
         else:
-            self.phase = PHASE_GRAZING_HIT
-        
-        gamestate.then(self)
+            return PHASE_GRAZING_HIT
     
     def solid_hit(self, gamestate):
-        self.hit_damage = Fraction(1, 1) * self.initial_damage
-        self.phase = PHASE_APPLY_ARMOR_REDUCTION
-        gamestate.then(self)
+        self.hit_damage = self.initial_damage * HALF_POINTS
+        return PHASE_APPLY_ARMOR_REDUCTION
     
     def grazing_hit(self, gamestate):
-        self.hit_damage = Fraction(1, 2) * self.initial_damage
-        self.phase = PHASE_APPLY_ARMOR_REDUCTION
-        gamestate.then(self)
+        self.hit_damage = self.initial_damage
+        return PHASE_APPLY_ARMOR_REDUCTION
 
     def missed_attack(self, gamestate):
         self.hit_damage = 0
+        return None
     
     def apply_armor_reduction(self, gamestate):
+        self.reactor_damage = self.hit_damage
         if not self.piercing:
-            reduction = Fraction(self.target.stats.hull, 2)
-            self.reactor_damage = self.hit_damage - reduction
-            if self.reactor_damage == 0:
-                return  # everything block
+            # each point of hull blocks half a point of damage
+            self.reactor_damage -= self.target.stats.hull
+        if self.reactor_damage <= 0:
+            return None  # everything blocked
         
-        Phase = PHASE_DEAL_REACTOR_STRESS
-        gamestate.then(self)
+        return PHASE_DEAL_REACTOR_STRESS
 
     def deal_reactor_stress(self, gamestate):
-        self.target.stress += self.reactor_damage
-        if self.target.stress > self.target.reactorLimit:
-            print('kaBOOM!')
+        self.target.half_stress += self.reactor_damage
+        if self.target.over_limit() and not self.target.melted:
+            if gamestate.log is not None:
+                gamestate.log.append((type(self.target), EVENT_MELTDOWN, 
+                    self.target.index, None, self.target.half_stress))
+            gamestate.meltdown(self.target)
+        return None
+
+    # indexed by phase
+    steps = tuple(step for phase, step in sorted({
+        PHASE_CHOOSE_TARGET: choose_target,
+        PHASE_ROLL_ACCURACY: roll_accuracy,
+        PHASE_SOLID_HIT: solid_hit,
+        PHASE_GRAZING_HIT: grazing_hit,
+        PHASE_MISSED_ATTACK: missed_attack,
+        PHASE_APPLY_ARMOR_REDUCTION: apply_armor_reduction,
+        PHASE_DEAL_REACTOR_STRESS: deal_reactor_stress,
+    }.items()))
+
+    def event(self):
+        # damage carried into this phase in half points, if there is any yet
+        amount = {
+            PHASE_SOLID_HIT: self.initial_damage * HALF_POINTS,
+            PHASE_GRAZING_HIT: self.initial_damage * HALF_POINTS,
+            PHASE_APPLY_ARMOR_REDUCTION: self.hit_damage,
+            PHASE_DEAL_REACTOR_STRESS: self.reactor_damage,
+        }.get(self.phase)
+        target = None if self.target is None else self.target.index
+        return AttackAction, self.phase, self.source.index, target, amount
     
     def __str__(self):
-        return {
-            PHASE_CHOOSE_TARGET: 'Choosing Target',
-            PHASE_ROLL_ACCURACY: 'Rolling Accuracy',
-            PHASE_SOLID_HIT: "Solid Hit",
-            PHASE_GRAZING_HIT: "Grazing Hit",
-            PHASE_MISSED_ATTACK: "Missed Attack",
-            PHASE_APPLY_ARMOR_REDUCTION: 'Applying Armor Reduction',
-            PHASE_DEAL_REACTOR_STRESS: 'Dealing Reactor Stress'
-        }[self.phase]
+        return PHASE_NAMES[self.phase]
+
+# --------- Card definitions ---------
+
+CARDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cards.txt')
+
+# bump when parse_cards changes what it returns, so old caches are ignored
+CARD_FORMAT = 1
+
+
+class CardDefinitionError(ValueError):
+    pass
+
+
+class AttackCard(Card):
+    """
+    One attack, the pilot chooses its target.
+    """
+    # (range, attack skill, defense skill, damage, piercing) per attack
+    attacks = ()
+
+    def play(self, gamestate):
+        (range, attack_skill, defense_skill, damage, piercing), = self.attacks
+        gamestate.then(
+            CardPlayedAction(self),
+            AttackAction.new(gamestate,
+                phase=PHASE_CHOOSE_TARGET,
+                source=self.mech,
+                range=range,
+                attack_skill=attack_skill,
+                defense_skill=defense_skill,
+                initial_damage=damage,
+                piercing=piercing,
+            ),
+            self.discard_me,
+        )
+
+
+class VolleyCard(AttackCard):
+    """
+    Several attacks, all at one random target in range.
+    """
+    def play(self, gamestate):
+        if not (targets := gamestate.targets(self.mech, self.range)):
+            return Card.play(self, gamestate)
+        target = gamestate.random.choice(targets)
+
+        gamestate.then(
+            CardPlayedAction(self),
+            *(AttackAction.new(gamestate,
+                phase=PHASE_ROLL_ACCURACY,
+                source=self.mech,
+                target=target,
+                range=range,
+                attack_skill=attack_skill,
+                defense_skill=defense_skill,
+                initial_damage=damage,
+                piercing=piercing,
+            )
+            for range, attack_skill, defense_skill, damage, piercing in self.attacks),
+            self.discard_me,
+        )
+
+
+ATTACK_LINE = re.compile(
+    r'(?P<range>[\w/]+?)(?:-range[d]?)? attack, '
+    r'(?P<attack>.+?) vs (?P<defense>.+?), '
+    r'onhit deal (?P<damage>\d+) (?P<piercing>piercing )?damage\.?',
+    re.IGNORECASE)
+
+RANGE_NAMES = 'melee', 'close', 'mid', 'long'
+
+
+def skill(text):
+    # "CPU" is short for "+CPU"
+    return ' '.join(t if t[0] in '+-' else '+' + t for t in text.split())
+
+
+def parse_cards(text, path='<cards>'):
+    """
+    Card definitions as plain data, see cards.txt for the format.
+    (name, docstring, stats, attacks) per card, every attack as
+    (range names, attack skill, defense skill, damage, piercing).
+    """
+    cards = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        where = f'{path}:{number}'
+
+        if heading := re.fullmatch(r'=== (.+) ===', line):
+            name = heading[1].replace(' ', '')
+            if not name.isidentifier() or name in (c[0] for c in cards):
+                raise CardDefinitionError(f'{where}: bad or repeated name {name}')
+            cards.append([name, [], '', []])
+        elif not cards or not line:
+            continue  # notes above the first card, blank lines
+        elif line.startswith('[') and line.endswith(']'):
+            cards[-1][2] = line[1:-1]
+            cards[-1][1].append(line)
+        elif line.startswith('--'):
+            cards[-1][1].append(line[2:].strip())
+        elif attack := ATTACK_LINE.fullmatch(line):
+            ranges = tuple(attack['range'].lower().split('/'))
+            if not set(ranges) <= set(RANGE_NAMES):
+                raise CardDefinitionError(f'{where}: unknown range in {line!r}')
+            cards[-1][3].append((ranges, skill(attack['attack']),
+                skill(attack['defense']), int(attack['damage']),
+                bool(attack['piercing'])))
+            cards[-1][1].append(line)
+        else:
+            raise CardDefinitionError(f'{where}: cannot read {line!r}')
+
+    for name, doc, stats, attacks in cards:
+        try:
+            for text in (stats, *(a[1] for a in attacks), *(a[2] for a in attacks)):
+                Stats._parse(text)
+        except (KeyError, ValueError, IndexError):
+            raise CardDefinitionError(f'{path}: bad stats in {name}') from None
+        if len({a[0] for a in attacks}) > 1:
+            raise CardDefinitionError(f'{path}: attacks of {name} have different ranges')
+
+    return [(name, '\n'.join(doc), stats, tuple(attacks))
+        for name, doc, stats, attacks in cards]
+
+
+def compile_card(name, doc, stats, attacks):
+    # a Card subclass with everything parsed up front
+    attrs = {
+        '__module__': __name__,
+        '__qualname__': name,
+        '__doc__': doc or None,
+        'stats': Stats.parse(stats),
+    }
+    base = Card
+    if attacks:
+        base = AttackCard if len(attacks) == 1 else VolleyCard
+        attrs['attacks'] = tuple(
+            (EffectRange(**dict.fromkeys(ranges, True)),
+                Stats.parse(attack_skill), Stats.parse(defense_skill),
+                damage, piercing)
+            for ranges, attack_skill, defense_skill, damage, piercing in attacks)
+        attrs['range'] = attrs['attacks'][0][0]
+    return type(name, (base,), attrs)
+
+
+def load_cards(path, cache=True):
+    """
+    Compile a card definition file, returns {class name: card class}.
+    The parsed definitions are kept in __pycache__ next to the file,
+    under a hash of its contents, so only a changed file is parsed again.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    folder = os.path.join(os.path.dirname(path), '__pycache__')
+    stem = os.path.basename(path) + '.'
+    digest = hashlib.sha256(source + bytes([CARD_FORMAT])).hexdigest()[:16]
+    cached = os.path.join(folder, f'{stem}{digest}.pickle')
+
+    try:
+        if not cache:
+            raise FileNotFoundError(cached)
+        with open(cached, 'rb') as f:
+            specs = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        specs = parse_cards(source.decode(), path)
+        if cache:
+            try:
+                os.makedirs(folder, exist_ok=True)
+                for old in os.listdir(folder):
+                    if old.startswith(stem) and old.endswith('.pickle'):
+                        os.remove(os.path.join(folder, old))
+                with open(cached, 'wb') as f:
+                    pickle.dump(specs, f)
+            except OSError:
+                pass  # read-only checkout, parse every time
+
+    return {spec[0]: compile_card(*spec) for spec in specs}
+
 
 # ------------- Cards ----------------
 
-class GMSCore(Card):
-    stats = Stats.parse("+HULL +AGI +CPU")
+# the plain stat and attack cards, see cards.txt
+DEFINED_CARDS = load_cards(CARDS_FILE)
+globals().update(DEFINED_CARDS)
+
 
 class GMSProcessor(Card):
     """
     Grants an additional point of CPU when used defensively.
     """
     stats = Stats.parse("+2CPU")
+    triggers = (AttackAction, PHASE_ROLL_ACCURACY, TRIGGER_TARGET),
 
     def canReactTo(self, gamestate):
         pending = gamestate.pending[-1]
-        return (pending.target is self
-            and hasattr(pending, 'defense_skill')
-            and pending.defense_skill.cpu
-        )
+        return (
+            type(pending) is AttackAction and
+            pending.phase is PHASE_ROLL_ACCURACY and
+            pending.target is self.mech and
+            pending.defense_skill.cpu)
     
-    def reaction(self, gamestate):
+    def playReactively(self, gamestate):
         pending = gamestate.pending[-1]
-        pending.bias += pending.cpu
+        pending.defense_bonus += pending.defense_skill.cpu
 
 
 class FuelInjectors(Card):
@@ -370,19 +1230,15 @@ class FragGrenade(Card):
     Hits all enemies at close range for 1 damage.
     This damage can still be reduced by armor.
     """
+    range = EffectRange(close=True)
+
     def play(self, gamestate):
-        targets = [
-            m for m in gamestate.mechs if
-            m.team != self.mech.team and
-            EffectRange(close=True).covers(
-                self.mech.distanceTo(m)
-            )
-        ]
-        random.shuffle(targets)
+        targets = list(gamestate.targets(self.mech, self.range))
+        gamestate.random.shuffle(targets)
 
         gamestate.then(
             CardPlayedAction(self),
-            *(AttackAction(
+            *(AttackAction.new(gamestate,
                 phase=PHASE_SOLID_HIT,
                 initial_damage=1,
                 source=self.mech,
@@ -398,7 +1254,7 @@ class EmergencyCoolant(Card):
     If your heat gauge is full, clear it, then scrap me.
     """
 
-    def clear_heat_action(self):
+    def clear_heat_action(self, gamestate):
         if self.procs():
             self.mech.heat -= self.mech.heat_gauge
     
@@ -425,36 +1281,34 @@ class AblativeArmor(Card):
     then scrap me.
     """
     stats = Stats.parse("+HULL")
+    triggers = (AttackAction, PHASE_DEAL_REACTOR_STRESS, TRIGGER_TARGET),
 
     def canReactTo(self, gamestate) -> bool:
         pending = gamestate.pending[-1]
-        return all((
-            type(pending) is AttackAction,
-            pending.phase is PHASE_DEAL_REACTOR_STRESS,
-            pending.target is self.mech,
-        ))
+        return (
+            type(pending) is AttackAction and
+            pending.phase is PHASE_DEAL_REACTOR_STRESS and
+            pending.target is self.mech)
 
-    def reaction(self, gamestate):
+    def playReactively(self, gamestate):
         pending = gamestate.pending[-1]
-        pending.reactor_damage = max(0, pending.reactor_damage-2)
+        pending.reactor_damage = max(0, pending.reactor_damage - 2*HALF_POINTS)
         gamestate.then(self.scrap_me)
 
-class ArmorPlating(Card):
-    stats = Stats.parse("+2HULL")
-
-class HeavyPlating(Card):
-    stats = Stats.parse("+3HULL -AGI")
 
 class JetBoost(Card):
     """
     Reaction -- if my agility lets you dodge an attack, take 2 heat.
     """
     stats = Stats.parse("+3AGI")
+    triggers = (AttackAction, PHASE_MISSED_ATTACK, TRIGGER_TARGET),
 
     def canReactTo(self, gamestate):
         pending = gamestate.pending[-1]
         if type(pending) is not AttackAction:
             return False
+        if pending.target is not self.mech:
+            return False
         
         margin = pending.offense - pending.defense
         return all((
@@ -463,124 +1317,23 @@ class JetBoost(Card):
             margin <= 3*agi_mult,
         ))
     
-    def reaction(self, gamestate):
+    def playReactively(self, gamestate):
         self.mech.heat += 2
 
-class Sidestep(Card):
-    stats = Stats.parse("+AGI")
-
-class ShootPistol(Card):
-    """
-    Close/Mid-range attack, +2 vs AGI, onhit deal 2 damage
-    """
-    def play(self, gamestate):
-        attack = AttackAction(
-            phase=PHASE_CHOOSE_TARGET, 
-            source=self.mech,
-            attack_skill=Stats.parse("+2"),
-            defense_skill=Stats.parse("+AGI"),
-            range=EffectRange(close=True, mid=True),
-            initial_damage=2,
-        )
-        gamestate.then(
-            CardPlayedAction(self),
-            attack, self.discard_me
-        )
-
-
-class Reload(Card):
-    """
-    Passes your turn.
-    """
-    pass
-
-class StabNSlice(Card):
-    """
-    Make two close-range attacks, both AGI vs AGI to hit.
-    First attack is a stab, dealing 1 piercing damage.
-    The second is a slash, dealing 1 regular damage.
-    """
-
-    def play(self, gamestate):
-        target = random.choice(
-            m for m in gamestate.mechs if
-            m.team != self.mech.team and
-            EffectRange(close=True).covers(
-                self.mech.distanceTo(m)
-            )
-        )
-
-        Stab = AttackAction(
-            phase=PHASE_ROLL_ACCURACY,
-            target=target, source=self.mech,
-            attack_skill=Stats.parse("+AGI"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=1,
-            piercing=True
-        )
-
-        Slice = AttackAction(
-            phase=PHASE_ROLL_ACCURACY,
-            target=target, source=self.mech,
-            attack_skill=Stats.parse("+AGI"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=1,
-            piercing=False
-        )
-
-        gamestate.then(
-            CardPlayedAction(self),
-            Stab, Slice,
-            self.discard_me,
-        )
-
-class Overswing(Card):
-    """
-    Melee attack, +0 vs AGI, onhit deal 6 damage.
-    """
-    def play(self, gamestate):
-        attack = AttackAction(
-            phase=PHASE_CHOOSE_TARGET,
-            source=self.mech,
-            range=EffectRange(melee=True),
-            attack_skill=Stats.parse("+0"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=6,
-        )
-        gamestate.then(
-            CardPlayedAction(self),
-            attack, self.discard_me
-        )
-
-class Bonk(Card):
-    """
-    Melee attack, +1 vs AGI, onhit deal 3 damage.
-    """
-    def play(self, gamestate):
-        attack = AttackAction(
-            phase=PHASE_CHOOSE_TARGET,
-            source=self.mech,
-            range=EffectRange(melee=True),
-            attack_skill=Stats.parse("+1"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=3,
-        )
-        gamestate.then(
-            CardPlayedAction(self),
-            attack, self.discard_me
-        )
 
 class ReinforcedActuators(Card):
     """
     Passive -- Landing a solid hit with a melee weapon grants +1 damage.
     """
     stats = Stats.parse("+HULL")
+    triggers = (AttackAction, PHASE_SOLID_HIT, TRIGGER_SOURCE),
 
-    def canReact(self, gamestate):
+    def canReactTo(self, gamestate):
         pending = gamestate.pending[-1]
         return (
             (type(pending) is AttackAction) and
             (pending.source is self.mech) and
+            (pending.range is not None) and
             (pending.range.melee is True) and 
             (pending.phase is PHASE_SOLID_HIT))
 
@@ -588,65 +1341,12 @@ class ReinforcedActuators(Card):
         pending = gamestate.pending[-1]
         pending.initial_damage += 1
 
-class Snipe(Card):
-    """
-    Mid/Long-ranged attack, CPU vs AGI, onhit deal 2 damage.
-    """
-    stats = Stats.parse("+CPU")
-
-    def play(self, gamestate):
-        attack = AttackAction(
-            phase=PHASE_CHOOSE_TARGET,
-            source=self.mech,
-            range=EffectRange(mid=True, long=True),
-            attack_skill=Stats.parse("+CPU"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=2,
-        )
-
-        gamestate.then(
-            CardPlayedAction(self),
-            attack,
-            self.discard_me,
-        )
-
-
-
-class BurstFire(Card):
-    """
-    Close/Mid-ranged attack, +2 vs AGI, onhit deal 2 damage.
-    Close/Mid-ranged attack, +3 vs AGI, onhit deal 1 damage.
-    """
-    def play(self, gamestate):
-        target = random.choice([
-            m for m in gamestate.mechs if
-            m.team != self.mech.team and
-            EffectRange(close=True).covers(
-                self.mech.distanceTo(m)
-            )
-        ])
-
-        Shot1 = AttackAction(
-            phase=PHASE_ROLL_ACCURACY,
-            target=target, source=self.mech,
-            attack_skill=Stats.parse("+2"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=2,
-        )
-
-        Shot2 = AttackAction(
-            phase=PHASE_ROLL_ACCURACY,
-            target=target, source=self.mech,
-            attack_skill=Stats.parse("+3"),
-            defense_skill=Stats.parse("+AGI"),
-            initial_damage=1,
-        )
 
-        gamestate.then(
-            CardPlayedAction(self),
-            Shot1, Shot2,
-            self.discard_me,
-        )
+# every card there is, by class name
+CARDS = dict(sorted({**DEFINED_CARDS, **{card.__name__: card for card in (
+    GMSProcessor, FuelInjectors, FragGrenade, EmergencyCoolant,
+    AblativeArmor, JetBoost, ReinforcedActuators,
+)}}.items()))
 
 
 # ------------- Mechs ----------------
@@ -0,0 +1,152 @@
+"""
+Monte Carlo tree search pilot, so pilot skill can be search strength.
+
+Open loop: tree nodes are sequences of this pilot's own card choices.
+Everything in between (initiative, targets, the other side's plays) is
+sampled fresh on every rollout, from a snapshot of the real battle.
+"""
+import math
+import time
+import random
+
+from main import Pilot, DEFAULT_PILOT, HALF_POINTS
+
+
+class Node:
+    __slots__ = 'visits', 'value', 'children'
+
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+        self.children = {}  # card type -> Node
+
+    def select(self, options, exploration):
+        # try every option once, then UCT
+        for option in options:
+            if option not in self.children:
+                return option
+
+        log = math.log(self.visits)
+        return max(options, key=lambda option: (
+            self.children[option].value / self.children[option].visits +
+            exploration * math.sqrt(log / self.children[option].visits)))
+
+
+def reward(game, team):
+    result = game.result
+    if result.winner is not None:
+        return float(result.winner == team)
+
+    # no winner, so score how close each side came to melting down
+    def strain(mechs):
+        mechs = list(mechs)
+        return sum(m.half_stress / (m.reactorLimit * HALF_POINTS)
+            for m in mechs) / len(mechs)
+
+    margin = (strain(m for m in game.mechs if m.team != team) -
+        strain(m for m in game.mechs if m.team == team))
+    return 0.5 + max(-0.5, min(0.5, margin / 2))
+
+
+def options(mech):
+    # one card of each type, the oldest, since copies play the same
+    return {type(card): card for card in mech.hand}
+
+
+class TreeWalker(Pilot):
+    """
+    Stands in for an MCTSPilot during its own rollouts.
+    """
+    def __init__(self, root, exploration):
+        self.node = root
+        self.path = [root]
+        self.exploration = exploration
+
+    def choose_card(self, gamestate, mech):
+        if self.node is None:
+            return super().choose_card(gamestate, mech)  # left the tree
+
+        cards = options(mech)
+        kind = self.node.select(cards, self.exploration)
+
+        if (child := self.node.children.get(kind)) is None:
+            child = self.node.children[kind] = Node()
+            self.node = None    # expanded, roll out from here
+        else:
+            self.node = child
+
+        self.path.append(child)
+        return cards[kind]
+
+
+class MCTSPilot(Pilot):
+    """
+    Picks cards by searching for `budget` seconds per decision (or for
+    `iterations` rollouts, whichever runs out first), and keeps the
+    subtree under each choice for the next one. One pilot per mech.
+    """
+    def __init__(self, budget=0.05, iterations=None, horizon=200,
+            exploration=1.4, seed=None):
+        assert budget or iterations
+        self.budget = budget
+        self.iterations = iterations
+        self.horizon = horizon
+        self.exploration = exploration
+        self.random = random.Random(seed)
+
+        self.game = None
+        self.root = None
+
+    def choose_card(self, game, mech):
+        if game is not self.game or self.root is None:
+            self.game, self.root = game, Node()
+        root = self.root
+
+        cards = options(mech)
+        if len(cards) > 1:
+            self.search(game, mech, root)
+            # the reused subtree may know cards that have left the hand since
+            kind = max(cards, key=lambda k:
+                root.children[k].visits if k in root.children else -1)
+        else:
+            kind, = cards
+
+        # whatever happens until our next decision, start from this subtree
+        self.root = root.children.get(kind)
+        return cards[kind]
+
+    def search(self, game, mech, root):
+        snapshot = game.snapshot()
+        pilots, max_actions = game.pilots, game.max_actions
+        # rollouts aren't part of the battle, keep them out of its counters
+        profile, game.profile = game.profile, None
+        eligible = game.eligible_hits, game.eligible_misses
+        deadline = self.budget and time.perf_counter() + self.budget
+
+        done = 0
+        while not (
+            (self.iterations and done >= self.iterations) or
+            (deadline and done and time.perf_counter() > deadline)
+        ):
+            game.restore(snapshot)
+            game.random.seed(self.random.getrandbits(64))
+
+            walker = TreeWalker(root, self.exploration)
+            game.pilots = [walker if p is self else DEFAULT_PILOT for p in pilots]
+            game.max_actions = game.actions + self.horizon
+
+            walker.choose_card(game, mech).play(game)
+            game.execute()
+            while game.result is None:
+                game.turn()
+
+            value = reward(game, mech.team)
+            for node in walker.path:
+                node.visits += 1
+                node.value += value
+            done += 1
+
+        game.restore(snapshot)
+        game.pilots, game.max_actions = pilots, max_actions
+        game.profile = profile
+        game.eligible_hits, game.eligible_misses = eligible
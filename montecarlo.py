@@ -0,0 +1,94 @@
+"""
+Pilot skill resolution, see the README.
+
+Simulate ~100 games of the same matchup, sort the outcomes, and pick
+the one at the percentile given by the sigmoid of the skill difference.
+Battles are spread across a process pool, one chunk of seeds per worker.
+Pass cache=<path> to look battles up in a ResultCache before playing them.
+"""
+import os
+import copy
+import math
+import contextlib
+
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from main import BattleManager, split_seed
+from resultcache import ResultCache
+
+
+GAMES = 100
+
+
+class Encounter:
+    def __init__(self, outcomes, percentile):
+        self.outcomes = sorted(outcomes)
+        self.percentile = percentile
+
+    @property
+    def pick(self):
+        index = int(self.percentile * len(self.outcomes))
+        return self.outcomes[min(index, len(self.outcomes) - 1)]
+
+    def __repr__(self):
+        return f'ENCOUNTER :: {self.pick} at p{round(100*self.percentile)} of {len(self.outcomes)}'
+
+
+def skill_percentile(skill_a, skill_b):
+    # sigmoid of the skill difference, from team a's point of view,
+    # only ever exp() of a negative number so big gaps can't overflow
+    gap = skill_b - skill_a
+    if gap > 0:
+        return math.exp(-gap) / (1 + math.exp(-gap))
+    return 1 / (1 + math.exp(gap))
+
+
+def outcome(mechs, result, team):
+    # reactor stress dealt minus reactor stress taken
+    dealt = sum(s for m, s in zip(mechs, result.stress) if m.team != team)
+    taken = sum(s for m, s in zip(mechs, result.stress) if m.team == team)
+    return dealt - taken
+
+
+def run_battle(team_a, team_b, seed, cache=None):
+    # copy both teams together, so cards keep pointing at the right mechs
+    mechs = [*team_a, *team_b]
+
+    if cache is None:
+        result = BattleManager(copy.deepcopy(mechs), seed=seed).simulate()
+    else:
+        result = cache.simulate(mechs, seed, copy_mechs=True)
+    return outcome(mechs, result, team_a[0].team)
+
+
+def run_chunk(team_a, team_b, seeds, cache=None):
+    if cache is None:
+        return [run_battle(team_a, team_b, seed) for seed in seeds]
+    with ResultCache(cache) as results:
+        return [run_battle(team_a, team_b, seed, results) for seed in seeds]
+
+
+def chunked(seeds, n):
+    size = -(-len(seeds) // n)
+    return [seeds[i:i+size] for i in range(0, len(seeds), size)]
+
+
+def run_encounter(team_a, team_b, games=GAMES, skill_a=0, skill_b=0,
+        seed=0, processes=None, pool=None, cache=None):
+    """
+    Play `games` battles between two lists of equipped mechs.
+    Pass `pool` to reuse a warm executor across encounters.
+    """
+    seeds = [split_seed(seed, i) for i in range(games)]
+    chunks = chunked(seeds, processes or os.cpu_count())
+
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(ProcessPoolExecutor(processes))
+
+        results = pool.map(run_chunk,
+            repeat(team_a), repeat(team_b), chunks, repeat(cache))
+        outcomes = [o for chunk in results for o in chunk]
+
+    return Encounter(outcomes, skill_percentile(skill_a, skill_b))
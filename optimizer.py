@@ -0,0 +1,171 @@
+"""
+Loadout optimizer, searches GMS_Everest.equip card lists for the one
+that wins most against a fixed pool of opponents.
+
+Candidates are scored with successive halving: every survivor plays a
+few battles, the worse half is dropped, and the next round doubles the
+battles for whoever is left, so the compute goes to the close contenders.
+Every candidate plays the same seeds, and battles run on a process pool.
+Pass cache=<path> to look battles up in a ResultCache before playing them.
+"""
+import os
+import math
+import random
+import contextlib
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import loadouts
+import resultcache
+
+from main import BattleManager, split_seed
+
+
+CARD_POOL = list(main.CARDS.values())
+
+DECK_SIZE = 12
+MAX_COPIES = 3
+
+
+def legal(cards, deck_size=DECK_SIZE, max_copies=MAX_COPIES):
+    return (len(cards) == deck_size and
+        max(Counter(cards).values()) <= max_copies)
+
+
+def canonical(cards):
+    # decks are never shuffled, so a multiset is played in name order
+    return tuple(sorted(cards, key=lambda c: c.__name__))
+
+
+def sample_loadouts(n, pool=CARD_POOL, deck_size=DECK_SIZE,
+        max_copies=MAX_COPIES, seed=None):
+    rng = random.Random(seed)
+    seen = set()
+    while len(seen) < n:
+        cards = []
+        while len(cards) < deck_size:
+            card = rng.choice(pool)
+            if cards.count(card) < max_copies:
+                cards.append(card)
+        seen.add(canonical(cards))
+    return sorted(seen, key=lambda cards: [c.__name__ for c in cards])
+
+
+def battle(cards, opponent, seed, cache=None):
+    # 1 for a win, 0 for a loss, a half for anything else
+    mechs = [
+        loadouts.build('Candidate', cards, 'candidate'),
+        loadouts.build('Opponent', opponent, 'opponent'),
+    ]
+    if cache is None:
+        result = BattleManager(mechs, seed=seed).simulate()
+    else:
+        result = cache.simulate(mechs, seed)
+    if result.winner is None:
+        return 0.5
+    return float(result.winner == 'candidate')
+
+
+def run_battles(cards, opponents, seeds, cache=None):
+    def total(results=None):
+        return sum(
+            battle(cards, opponents[i % len(opponents)], seed, results)
+            for i, seed in enumerate(seeds))
+
+    if cache is None:
+        return total()
+    with resultcache.ResultCache(cache) as results:
+        return total(results)
+
+
+def wilson(points, n, z=1.96):
+    # score interval for a win rate, draws count as half a win
+    if not n:
+        return 0.0, 1.0
+    p = points / n
+    centre = (p + z*z / (2*n)) / (1 + z*z / n)
+    spread = z * math.sqrt(p*(1 - p)/n + z*z / (4*n*n)) / (1 + z*z / n)
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+
+class Candidate:
+    def __init__(self, cards):
+        if not legal(cards):
+            raise ValueError(f'not a legal loadout: {cards}')
+        self.cards = canonical(cards)
+        self.points = 0.0
+        self.battles = 0
+
+    @property
+    def win_rate(self):
+        return self.points / self.battles if self.battles else 0.0
+
+    @property
+    def interval(self):
+        return wilson(self.points, self.battles)
+
+    def __repr__(self):
+        counts = Counter(c.__name__ for c in self.cards)
+        return ', '.join(f'{n}x {name}' for name, n in sorted(counts.items()))
+
+
+def successive_halving(candidates, opponents, battles=4, keep=0.5,
+        seed=0, processes=None, pool=None, cache=None):
+    """
+    Score card lists against the opponent card lists. Returns every
+    candidate, the ones that survived the most rounds first.
+    """
+    if not 0 < keep < 1:
+        raise ValueError('keep must be between 0 and 1')
+
+    candidates = [Candidate(cards) for cards in candidates]
+    alive = list(candidates)
+    played = 0
+    workers = processes or os.cpu_count()
+
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            pool = stack.enter_context(ProcessPoolExecutor(processes))
+
+        while True:
+            seeds = [split_seed(seed, played + i) for i in range(battles)]
+            points = pool.map(run_battles,
+                [c.cards for c in alive],
+                [opponents] * len(alive),
+                [seeds] * len(alive),
+                [cache] * len(alive),
+                chunksize=max(1, len(alive) // (4 * workers)))
+
+            for candidate, total in zip(alive, points):
+                candidate.points += total
+                candidate.battles += battles
+            played += battles
+
+            alive.sort(key=lambda c: c.win_rate, reverse=True)
+            # at least one goes every round, or a high keep never ends
+            alive = alive[:min(len(alive) - 1, math.ceil(len(alive) * keep))]
+            if len(alive) < 2:
+                break   # the last one standing needs no more battles
+            battles *= 2
+
+    return sorted(candidates,
+        key=lambda c: (c.battles, c.win_rate), reverse=True)
+
+
+def leaderboard(candidates, top=10):
+    lines = [f'{"#":>3} {"win":>5} {"95% interval":>13} {"battles":>7}  cards']
+    for rank, c in enumerate(candidates[:top], 1):
+        low, high = c.interval
+        lines.append(
+            f'{rank:>3} {c.win_rate:>5.2f} {low:>6.2f}-{high:<6.2f} {c.battles:>7}  {c}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    candidates = sample_loadouts(64, seed=0)
+    candidates += [loadouts.BIG_TUMPO, loadouts.LIL_UZI]
+    ranked = successive_halving(candidates, list(loadouts.LOADOUTS.values()),
+        cache=resultcache.DEFAULT_PATH)
+    print(leaderboard(ranked))
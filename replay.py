@@ -0,0 +1,193 @@
+"""
+Compact replays, a battle as its loadouts, its seed and the pilots'
+decisions, each one a small int (see DECISION_* in main.py).
+
+A replay re-runs the battle from scratch. Decisions a mech's pilot
+leaves to the default Pilot (MCTSPilot only picks cards, its targets and
+reactions are the default's random draws) are made again and checked
+against the recording, the rest are played back as recorded. Either way
+the replay has to end with the recorded result, anything else raises
+Divergence, which is how engine changes that alter battles show up.
+
+The choices a pilot makes itself must leave BattleManager.random as they
+found it (MCTSPilot restores it after every search), or its battles will
+not replay.
+"""
+import gzip
+import json
+import base64
+
+import main
+
+from main import (Pilot, BattleManager, MAX_ACTIONS,
+    DECISION_CARD, DECISION_TARGET, DECISION_REACTION, DECISION_BITS)
+
+
+# bump when the format changes
+VERSION = 2
+
+CHASSIS = {cls.__name__: cls for cls in (main.GMS_Everest,)}
+
+
+class Divergence(Exception):
+    pass
+
+
+# the Pilot method behind each kind of decision
+CHOOSERS = {
+    DECISION_CARD: 'choose_card',
+    DECISION_TARGET: 'choose_target',
+    DECISION_REACTION: 'choose_reaction',
+}
+
+
+def card_class(name):
+    if (cls := main.CARDS.get(name)) is None:
+        raise ValueError(f'unknown card {name}')
+    return cls
+
+
+def describe(mech):
+    # everything needed to build the mech again, before the battle
+    if mech.hand or mech.discard or mech.half_stress or mech.heat:
+        raise ValueError(f'{mech} has already been in a battle')
+    return (type(mech).__name__, mech.name, mech.team,
+        mech.frontline, mech.backline, [type(c).__name__ for c in mech.deck])
+
+
+def build(chassis, name, team, frontline, backline, cards):
+    mech = CHASSIS[chassis](name=name)
+    mech.equip(*map(card_class, cards))
+    mech.team = team
+    mech.frontline, mech.backline = frontline, backline
+    return mech
+
+
+class Replay:
+    def __init__(self, mechs, seed, max_actions, rerun, decisions, result):
+        self.mechs = mechs              # describe() per mech
+        self.seed = seed
+        self.max_actions = max_actions
+        self.rerun = rerun              # per mech, the DECISION_* its pilot leaves to Pilot
+        self.decisions = decisions      # bytes, one per decision
+        self.result = result            # (winner, actions, reason)
+
+    def __repr__(self):
+        winner, actions, reason = self.result
+        return f'REPLAY :: {winner} after {actions} actions ({reason}), {len(self.decisions)} decisions'
+
+    def dumps(self):
+        return json.dumps({
+            'v': VERSION,
+            'mechs': self.mechs,
+            'seed': self.seed,
+            'max_actions': self.max_actions,
+            'rerun': self.rerun,
+            'decisions': base64.b64encode(self.decisions).decode(),
+            'result': self.result,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, line):
+        data = json.loads(line)
+        if data.pop('v') != VERSION:
+            raise ValueError('replay from another format version')
+        data['decisions'] = base64.b64decode(data['decisions'])
+        data['mechs'] = [tuple(m) for m in data['mechs']]
+        data['result'] = tuple(data['result'])
+        return cls(**data)
+
+
+def default_decisions(pilot):
+    # kinds of decision made by Pilot's own method, so they can run again
+    return [kind for kind, name in CHOOSERS.items()
+        if getattr(type(pilot), name) is getattr(Pilot, name)]
+
+
+def record(mechs, seed=None, max_actions=MAX_ACTIONS):
+    # play a battle between fresh mechs, returns its result and replay
+    described = [describe(m) for m in mechs]
+    game = BattleManager(mechs, seed=seed, decisions=True)
+    result = game.simulate(max_actions)
+
+    if max(game.decisions, default=0) > 0xff:
+        raise ValueError('a decision does not fit in a byte')
+    return result, Replay(
+        mechs=described,
+        seed=seed,
+        max_actions=max_actions,
+        rerun=[default_decisions(p) for p in game.pilots],
+        decisions=bytes(game.decisions),
+        result=(result.winner, result.actions, result.reason),
+    )
+
+
+class ReplayPilot(Pilot):
+    """
+    Flies one mech of a replay, all of them share the decision stream.
+    """
+    def __init__(self, stream, rerun):
+        self.stream = stream
+        self.rerun = rerun
+
+    def next(self, kind, options, choose):
+        position, decision = next(self.stream, (None, None))
+        if decision is None:
+            raise Divergence('the battle needs more decisions than were recorded')
+        if decision & ((1 << DECISION_BITS) - 1) != kind:
+            raise Divergence(f'decision {position} was for something else')
+
+        index = decision >> DECISION_BITS
+        if index >= len(options):
+            raise Divergence(f'decision {position} picks from fewer options')
+
+        if kind in self.rerun:
+            if (choice := choose()) is not options[index]:
+                raise Divergence(f'decision {position} came out differently')
+            return choice
+        return options[index]
+
+    def choose_card(self, gamestate, mech):
+        return self.next(DECISION_CARD, mech.hand,
+            lambda: super(ReplayPilot, self).choose_card(gamestate, mech))
+
+    def choose_target(self, gamestate, attack, valid):
+        return self.next(DECISION_TARGET, valid,
+            lambda: super(ReplayPilot, self).choose_target(gamestate, attack, valid))
+
+    def choose_reaction(self, gamestate, possible):
+        return self.next(DECISION_REACTION, possible,
+            lambda: super(ReplayPilot, self).choose_reaction(gamestate, possible))
+
+
+def play(replay, record=False):
+    """
+    Re-run a replay, returns the finished BattleManager. Raises Divergence
+    if the battle does not go the way it was recorded.
+    """
+    stream = enumerate(replay.decisions)
+    mechs = [build(*m) for m in replay.mechs]
+    for mech, rerun in zip(mechs, replay.rerun):
+        mech.pilot = ReplayPilot(stream, rerun)
+
+    game = BattleManager(mechs, seed=replay.seed, record=record)
+    result = game.simulate(replay.max_actions)
+
+    if next(stream, None) is not None:
+        raise Divergence('the battle ended before all the decisions were used')
+    if (result.winner, result.actions, result.reason) != replay.result:
+        raise Divergence(f'ended as {result}, recorded {replay}')
+    return game
+
+
+def save(replays, path):
+    # one replay per line, gzipped
+    with gzip.open(path, 'wt') as f:
+        for replay in replays:
+            f.write(replay.dumps() + '\n')
+
+
+def load(path):
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            yield Replay.loads(line)
@@ -0,0 +1,151 @@
+"""
+Battle results kept on disk, so sweeps don't replay the same battles
+in every session.
+
+A battle is keyed by a hash of its mechs (chassis, team, lines, hand
+size, reactor and heat limits, starting stress and heat, and deck, in
+BattleManager order), its seed and action cap, and ENGINE_VERSION,
+a hash of main.py and cards.txt. Editing either one starts the cache
+over. Only battles flown by the default Pilot are cached, any other
+pilot plays its battle every time.
+
+Entries are SQLite rows, the least recently used ones go first once
+there are more than max_entries. Several processes can share a file.
+"""
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+
+from fractions import Fraction
+
+import main
+
+from main import Pilot, BattleManager, BattleResult, HALF_POINTS, MAX_ACTIONS
+
+
+def engine_version():
+    digest = hashlib.sha256()
+    for path in (main.__file__, main.CARDS_FILE):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+ENGINE_VERSION = engine_version()
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'results.sqlite')
+
+
+def battle_key(mechs, seed, max_actions):
+    # None if the battle can't be cached
+    if any(type(m.pilot) is not Pilot for m in mechs):
+        return None
+    if any(m.hand or m.discard or m.half_stress or m.heat for m in mechs):
+        return None
+
+    battle = [ENGINE_VERSION, seed, max_actions, [
+        (type(m).__name__, m.team, m.frontline, m.backline,
+            m.handsize, m.reactorLimit, m.heat_gauge, m.half_stress, m.heat,
+            [type(c).__name__ for c in m.deck])
+        for m in mechs]]
+    return hashlib.sha256(json.dumps(battle).encode()).hexdigest()
+
+
+def dump_result(result):
+    return json.dumps([result.winner, result.actions,
+        [int(s * HALF_POINTS) for s in result.stress],
+        list(result.heat), result.reason])
+
+
+def load_result(text):
+    winner, actions, stress, heat, reason = json.loads(text)
+    return BattleResult(winner, actions,
+        tuple(Fraction(s, HALF_POINTS) for s in stress), tuple(heat), reason)
+
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_PATH, max_entries=1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.touched = []   # keys looked up since the last commit
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                '(key TEXT PRIMARY KEY, result TEXT, used REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta '
+                '(name TEXT PRIMARY KEY, value TEXT)')
+
+            version = self.db.execute(
+                "SELECT value FROM meta WHERE name = 'engine'").fetchone()
+            if version != (ENGINE_VERSION,):
+                # results from another engine can never be looked up again
+                self.db.execute('DELETE FROM results')
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('engine', ?)",
+                    (ENGINE_VERSION,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get(self, key):
+        row = self.db.execute(
+            'SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched.append(key)
+        return load_result(row[0])
+
+    def put(self, key, result):
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+            (key, dump_result(result), time.time()))
+
+    def simulate(self, mechs, seed, max_actions=MAX_ACTIONS, copy_mechs=False):
+        """
+        BattleManager(mechs, seed).simulate(max_actions), unless the
+        result is already known. With copy_mechs, the battle is played
+        by deep copies, and only on a miss.
+        """
+        key = battle_key(mechs, seed, max_actions)
+        if key is not None and (result := self.get(key)) is not None:
+            return result
+
+        if copy_mechs:
+            mechs = copy.deepcopy(mechs)
+        result = BattleManager(mechs, seed=seed).simulate(max_actions)
+        if key is not None:
+            self.put(key, result)
+        return result
+
+    def commit(self):
+        with self.db:
+            now = time.time()
+            self.db.executemany('UPDATE results SET used = ? WHERE key = ?',
+                ((now, key) for key in self.touched))
+            self.touched.clear()
+
+            extra = len(self) - self.max_entries
+            if extra > 0:
+                self.db.execute('DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY used LIMIT ?)', (extra,))
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -0,0 +1,341 @@
+"""
+Local encounter service, so clients get percentile outcomes without
+starting Python and importing the engine for every question.
+
+An asyncio server takes one JSON request per line and answers each with
+one JSON line, on a process pool that is started and warmed up before
+the first connection. A request is two loadouts, either a name from
+loadouts.LOADOUTS or a list of card names, plus optional skills, games
+and seed:
+
+    {"a": "LilUzi", "b": ["GMSCore", ...], "skill_a": 2, "games": 100}
+    -> {"pick": "-3/2", "percentile": 0.88, "games": 100}
+
+Skills only move the percentile, so requests that differ in nothing but
+skill share their battles. Identical battles already in flight are
+played once for everyone waiting on them, and at most `limit` encounters
+are on the pool at a time, later ones queue. {"stats": true} returns
+the counters. A bad request or a failed encounter is answered with
+{"error": "..."}, and the connection stays open.
+
+    python service.py serve --processes 4     # run the service
+    python service.py ask LilUzi BigTumpo     # one request
+    python service.py load --clients 20       # load test
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import random
+import asyncio
+import argparse
+
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import loadouts
+import resultcache
+
+from main import BattleManager, split_seed
+from montecarlo import GAMES, Encounter, skill_percentile, run_chunk, chunked
+
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# encounters on the pool at once
+LIMIT = 4
+
+MAX_GAMES = 10_000
+
+
+class ServiceError(Exception):
+    pass
+
+
+def warm_up():
+    # runs once in every worker, so the first request doesn't pay for imports
+    BattleManager([loadouts.build('A', loadouts.LIL_UZI, 'a'),
+        loadouts.build('B', loadouts.BIG_TUMPO, 'b')], seed=0).simulate()
+
+
+def loadout(value):
+    # card names for a loadout name or a list of card names
+    if isinstance(value, str):
+        if value not in loadouts.LOADOUTS:
+            raise ValueError(f'unknown loadout {value}')
+        return [card.__name__ for card in loadouts.LOADOUTS[value]]
+    if not isinstance(value, list) or not value:
+        raise ValueError('a loadout is a name or a list of card names')
+    for name in value:
+        if not isinstance(name, str) or name not in main.CARDS:
+            raise ValueError(f'unknown card {name}')
+    return list(value)
+
+
+def skill(value):
+    # a finite number, bools are JSON's true and false, not skills
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('skills must be numbers')
+    if not math.isfinite(value):
+        raise ValueError('skills must be finite')
+    return float(value)
+
+
+def parse(request):
+    # (battles, skills) for a request, battles being the coalescing key
+    games = request.get('games', GAMES)
+    seed = request.get('seed', 0)
+    if not isinstance(games, int) or not 0 < games <= MAX_GAMES:
+        raise ValueError(f'games must be from 1 to {MAX_GAMES}')
+    if not isinstance(seed, int):
+        raise ValueError('seed must be an int')
+
+    battles = (tuple(loadout(request.get('a'))), tuple(loadout(request.get('b'))),
+        games, seed)
+    skills = (skill(request.get('skill_a', 0)), skill(request.get('skill_b', 0)))
+    return battles, skills
+
+
+class Service:
+    def __init__(self, processes=None, limit=LIMIT, cache=None):
+        self.processes = processes or os.cpu_count()
+        self.pool = ProcessPoolExecutor(processes, initializer=warm_up)
+        self.limit = asyncio.Semaphore(limit)
+        self.cache = cache              # ResultCache path, or None
+        self.server = None
+
+        # battles key -> task playing them
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.encounters = 0
+
+    async def start(self, host=HOST, port=PORT):
+        # every worker is forked and warm before the first connection
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, int)
+            for _ in range(self.processes)))
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.pool.shutdown()
+
+    def stats(self):
+        return {'requests': self.requests, 'coalesced': self.coalesced,
+            'encounters': self.encounters, 'in_flight': len(self.in_flight)}
+
+    # ------------ requests ---------------
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                writer.write(json.dumps(await self.answer(line)).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def answer(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request is a JSON object')
+            if request.get('stats'):
+                return self.stats()
+            battles, skills = parse(request)
+        except ValueError as e:
+            return {'error': str(e)}
+
+        self.requests += 1
+        try:
+            encounter = Encounter(await self.outcomes(battles), skill_percentile(*skills))
+        except Exception as e:
+            # a failed battle is an answer too, not a dropped connection
+            return {'error': f'{type(e).__name__}: {e}'}
+        return {'pick': str(encounter.pick), 'percentile': encounter.percentile,
+            'games': len(encounter.outcomes)}
+
+    async def outcomes(self, battles):
+        # shielded, a client hanging up doesn't cancel the battles for the others
+        if (task := self.in_flight.get(battles)) is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self.play(*battles))
+            self.in_flight[battles] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(battles))
+        return await asyncio.shield(task)
+
+    async def play(self, cards_a, cards_b, games, seed):
+        team_a = [loadouts.build('A', [main.CARDS[c] for c in cards_a], 'a')]
+        team_b = [loadouts.build('B', [main.CARDS[c] for c in cards_b], 'b')]
+        seeds = [split_seed(seed, i) for i in range(games)]
+
+        async with self.limit:
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(self.pool,
+                    run_chunk, team_a, team_b, chunk, self.cache)
+                for chunk in chunked(seeds, self.processes)))
+        self.encounters += 1
+        return [o for chunk in chunks for o in chunk]
+
+
+async def serve(host=HOST, port=PORT, processes=None, limit=LIMIT, cache=None):
+    service = Service(processes, limit, cache)
+    host, port = await service.start(host, port)
+    print(f'serving on {host}:{port}', file=sys.stderr)
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+
+# ------------ client ---------------
+
+class Client:
+    """
+    Blocking client, one request at a time over one connection.
+    """
+    def __init__(self, host=HOST, port=PORT, timeout=None):
+        self.socket = socket.create_connection((host, port), timeout)
+        self.file = self.socket.makefile('rw')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def request(self, request):
+        self.file.write(json.dumps(request) + '\n')
+        self.file.flush()
+        if not (line := self.file.readline()):
+            raise ServiceError('the service closed the connection')
+        answer = json.loads(line)
+        if 'error' in answer:
+            raise ServiceError(answer['error'])
+        return answer
+
+    def encounter(self, a, b, skill_a=0, skill_b=0, games=GAMES, seed=0):
+        # the picked outcome, reactor stress team a dealt minus taken
+        answer = self.request({'a': a, 'b': b, 'skill_a': skill_a,
+            'skill_b': skill_b, 'games': games, 'seed': seed})
+        return Fraction(answer['pick'])
+
+    def stats(self):
+        return self.request({'stats': True})
+
+
+async def load_test(host=HOST, port=PORT, clients=20, requests=10, distinct=5,
+        games=GAMES, seed=0):
+    """
+    `clients` connections each send `requests` requests, drawn from
+    `distinct` different encounters so some of them coalesce. Returns
+    latencies in seconds and the wall time.
+    """
+    rng = random.Random(seed)
+    names = list(loadouts.LOADOUTS)
+    variants = [{'a': rng.choice(names), 'b': rng.choice(names),
+        'skill_a': rng.randint(0, 4), 'games': games, 'seed': i}
+        for i in range(distinct)]
+
+    async def client(plan):
+        reader, writer = await asyncio.open_connection(host, port)
+        latencies = []
+        for request in plan:
+            start = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+            answer = json.loads(await reader.readline())
+            if 'error' in answer:
+                raise ServiceError(answer['error'])
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+        return latencies
+
+    plans = [[rng.choice(variants) for _ in range(requests)] for _ in range(clients)]
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*map(client, plans))
+    return sorted(l for ls in latencies for l in ls), time.perf_counter() - start
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='run the service')
+    serve_parser.add_argument('--processes', type=int)
+    serve_parser.add_argument('--limit', type=int, default=LIMIT,
+        help='encounters on the pool at once')
+    serve_parser.add_argument('--cache', nargs='?', const=resultcache.DEFAULT_PATH,
+        help='look battles up in a result cache first')
+
+    ask = commands.add_parser('ask', help='send one request')
+    ask.add_argument('a', help='loadout name, or card names joined with commas')
+    ask.add_argument('b')
+    ask.add_argument('--skill-a', type=float, default=0)
+    ask.add_argument('--skill-b', type=float, default=0)
+    ask.add_argument('--games', type=int, default=GAMES)
+    ask.add_argument('--seed', type=int, default=0)
+
+    load = commands.add_parser('load', help='load test a running service')
+    load.add_argument('--clients', type=int, default=20)
+    load.add_argument('--requests', type=int, default=10,
+        help='requests per client')
+    load.add_argument('--distinct', type=int, default=5,
+        help='different encounters among the requests')
+    load.add_argument('--games', type=int, default=GAMES)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, args.processes, args.limit, args.cache))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    with Client(args.host, args.port) as client:
+        if args.command == 'ask':
+            a, b = (v if v in loadouts.LOADOUTS else v.split(',') for v in (args.a, args.b))
+            try:
+                print(client.encounter(a, b, args.skill_a, args.skill_b, args.games, args.seed))
+            except ServiceError as e:
+                print(e, file=sys.stderr)
+                return 1
+            return 0
+        before = client.stats()
+
+    latencies, seconds = asyncio.run(load_test(args.host, args.port,
+        args.clients, args.requests, args.distinct, args.games))
+    with Client(args.host, args.port) as client:
+        after = client.stats()
+
+    def percentile(p):
+        return latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+
+    print(f'{len(latencies)} requests in {seconds:.2f}s, {len(latencies) / seconds:.1f}/s')
+    print(f'latency p50 {percentile(0.5)*1000:.0f}ms, p95 {percentile(0.95)*1000:.0f}ms, '
+        f'max {latencies[-1]*1000:.0f}ms')
+    print(f'{after["encounters"] - before["encounters"]} encounters played, '
+        f'{after["coalesced"] - before["coalesced"]} requests coalesced')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -1,60 +1,965 @@
 from main import *
+import json
 import random
 import unittest
 
+import mcts
+import bench
+import loadouts
+import montecarlo
+import optimizer
+import exact
+import export
+import replay
+import resultcache
+import service
+import tournament
 
+try:
+    import lockstep
+except ImportError:  # numpy is optional
+    lockstep = None
 
-class IntegrationTests(unittest.TestCase):
-    def setup(self):
-        BigTumpo = GMS_Everest(
-            name='BigTumpo'
-        )
-        BigTumpo.equip(
-            AblativeArmor,
-            GMSCore,
-            FragGrenade,
-
-            ArmorPlating,
-            HeavyPlating,
-            HeavyPlating,
-
-            Overswing,
-            Overswing,
-            Bonk,
-            Bonk,
-            Bonk,
-            ReinforcedActuators
-        )
 
-        LilUzi = GMS_Everest(
-            name='LilUzi'
-        )
-        LilUzi.equip(
-            GMSCore,
-            FuelInjectors,
-            AblativeArmor,
-
-            ShootPistol,
-            ShootPistol,
-            Reload,
-
-            Snipe,
-            Snipe,
-            BurstFire,
-            BurstFire,
-            BurstFire,
-            Reload,
-        )
+def BigTumpo(team='blue'):
+    return loadouts.build('BigTumpo', loadouts.BIG_TUMPO, team)
 
-        LilUzi.team = 'red'
-        BigTumpo.team = 'blue'
 
-        self.game = BattleManager([LilUzi, BigTumpo])
+def LilUzi(team='red'):
+    return loadouts.build('LilUzi', loadouts.LIL_UZI, team)
+
+
+class IntegrationTests(unittest.TestCase):
+    def setup(self):
+        self.game = BattleManager([LilUzi(), BigTumpo()])
 
     def test_1(self):
         self.setup()
         self.game.set_seed(1)
         self.game.play()
 
+
+class StatsTests(unittest.TestCase):
+    def test_add(self):
+        total = Stats(1, 2, 3, 4) + Stats(10, 10, 10, 10)
+        self.assertEqual(total, Stats(bias=11, hull=12, agi=13, cpu=14))
+        self.assertEqual(total - Stats(10, 10, 10, 10), Stats(1, 2, 3, 4))
+        self.assertEqual(Stats(1, 2, 3, 4).dotProduct(Stats(1, 0, 2, 0)), 7)
+
+    def test_parse(self):
+        self.assertEqual(Stats.parse("+3HULL -AGI"), Stats(hull=3, agi=-1))
+        self.assertEqual(Stats.parse("-2CPU +10"), Stats(bias=10, cpu=-2))
+        self.assertIs(Stats.parse("+AGI"), Stats.parse("+AGI"))
+
+    def test_immutable(self):
+        import copy, pickle
+
+        stats = Stats.parse("+HULL +AGI +CPU")
+        with self.assertRaises(AttributeError):
+            stats.hull = 3
+        with self.assertRaises(AttributeError):
+            del stats.hull
+        self.assertEqual(stats.hull, 1)
+        self.assertEqual(len({stats, Stats(0, 1, 1, 1)}), 1)
+        self.assertNotEqual(stats, None)
+        self.assertIn(stats, [None, 'HULL', Stats(0, 1, 1, 1)])
+        self.assertIs(copy.deepcopy(stats), stats)
+        self.assertEqual(pickle.loads(pickle.dumps(stats)), stats)
+
+
+class CardDefinitionTests(unittest.TestCase):
+    DEFINITIONS = """
+        === Tac Knife ===
+        [+AGI]
+        -- Stab, then slice.
+        Melee attack, AGI vs AGI, onhit deal 1 piercing damage
+        Melee attack, AGI vs AGI, onhit deal 2 damage
+    """
+
+    def test_compiled(self):
+        self.assertEqual(Snipe.stats, Stats.parse("+CPU"))
+        self.assertEqual(Snipe.range.mask, EffectRange(mid=True, long=True).mask)
+        self.assertTrue(issubclass(BurstFire, VolleyCard))
+        self.assertIs(CARDS['Bonk'], Bonk)
+
+        (name, doc, stats, attacks), = parse_cards(self.DEFINITIONS)
+        knife = compile_card(name, doc, stats, attacks)
+        self.assertEqual(knife.__name__, 'TacKnife')
+        self.assertEqual(knife.stats, Stats(agi=1))
+        self.assertTrue(knife.range.melee)
+        self.assertEqual([a[3:] for a in knife.attacks], [(1, True), (2, False)])
+
+    def test_errors(self):
+        for text in (
+            "=== Bad ===\nLong attack, +2 vs AGI, deal 2 damage",
+            "=== Bad ===\nFar attack, +2 vs AGI, onhit deal 2 damage",
+            "=== Bad ===\n[+2XYZ]",
+            "=== Bad ===\n=== Bad ===",
+        ):
+            with self.assertRaises(CardDefinitionError):
+                parse_cards(text)
+
+    def test_cache(self):
+        import os, tempfile
+        from unittest import mock
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'cards.txt')
+            with open(path, 'w') as f:
+                f.write(self.DEFINITIONS)
+
+            self.assertEqual(list(load_cards(path)), ['TacKnife'])
+            with mock.patch('main.parse_cards', side_effect=AssertionError):
+                self.assertEqual(list(load_cards(path)), ['TacKnife'])
+
+            with open(path, 'a') as f:
+                f.write("=== Tac Pistol ===\n")
+            self.assertEqual(list(load_cards(path)), ['TacKnife', 'TacPistol'])
+            self.assertEqual(len(os.listdir(os.path.join(folder, '__pycache__'))), 1)
+
+
+class HandStatsTests(unittest.TestCase):
+    def test_running_total(self):
+        mech = BigTumpo()
+        game = BattleManager([mech, LilUzi()])
+        for _ in range(5):
+            DrawCardAction(mech)(game)
+        self.assertEqual(mech.stats, Stats.parse("+HULL"))
+
+        mech.hand[-1].scrap_me(game)
+        mech.hand[0].discard_me(game)
+        for _ in range(2):
+            DrawCardAction(mech)(game)
+        self.assertEqual(mech.stats, mech.recompute_stats())
+        self.assertEqual(mech.stats, Stats.parse("+3HULL -AGI"))
+
+    def test_debug_mode(self):
+        BattleMech.debug_stats = True
+        try:
+            for seed in range(20):
+                game = BattleManager([LilUzi(), BigTumpo()])
+                game.set_seed(seed)
+                game.play()
+        finally:
+            BattleMech.debug_stats = False
+
+
+class DamageTests(unittest.TestCase):
+    def hit(self, phase, damage, hull, piercing=False):
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo])
+        for _ in range(hull):
+            uzi.add_to_hand(GMSCore(uzi))
+
+        game.then(AttackAction(phase=phase, source=tumpo, target=uzi,
+            initial_damage=damage, piercing=piercing))
+        game.execute()
+        return uzi.stress
+
+    def test_half_points(self):
+        self.assertEqual(self.hit(PHASE_SOLID_HIT, 3, hull=0), 3)
+        self.assertEqual(self.hit(PHASE_SOLID_HIT, 3, hull=1), Fraction(5, 2))
+        self.assertEqual(self.hit(PHASE_GRAZING_HIT, 3, hull=0), Fraction(3, 2))
+        self.assertEqual(self.hit(PHASE_GRAZING_HIT, 3, hull=3), 0)
+        # more hull than damage blocks it all, it never takes stress away
+        self.assertEqual(self.hit(PHASE_GRAZING_HIT, 1, hull=3), 0)
+        self.assertEqual(self.hit(PHASE_SOLID_HIT, 1, hull=3), 0)
+        # piercing damage ignores hull
+        self.assertEqual(self.hit(PHASE_SOLID_HIT, 3, hull=0, piercing=True), 3)
+        self.assertEqual(self.hit(PHASE_SOLID_HIT, 3, hull=3, piercing=True), 3)
+        self.assertEqual(self.hit(PHASE_GRAZING_HIT, 1, hull=3, piercing=True), Fraction(1, 2))
+
+    def test_armor_then_stress(self):
+        # apply_armor_reduction once set a misspelt `Phase`, so no stress was dealt
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo])
+        attack = AttackAction(phase=PHASE_APPLY_ARMOR_REDUCTION,
+            source=tumpo, target=uzi, hit_damage=3)
+
+        attack(game)
+        self.assertEqual(attack.phase, PHASE_DEAL_REACTOR_STRESS)
+        self.assertEqual(list(game.pending), [attack])
+        game.execute()
+        self.assertEqual(uzi.half_stress, 3)
+
+    def test_spare_attacks(self):
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo], seed=0)
+        first, second = Bonk(tumpo), Bonk(tumpo)
+        tumpo.add_to_hand(first)
+        tumpo.add_to_hand(second)
+
+        first.play(game)
+        attack = game.pending[-2]
+        game.execute()
+        self.assertEqual(game.spare_attacks, [attack])
+
+        second.play(game)
+        self.assertIs(game.pending[-2], attack)
+        self.assertEqual(attack.phase, PHASE_CHOOSE_TARGET)
+        self.assertEqual(attack.hit_damage, 0)
+
+
+class ReactionTests(unittest.TestCase):
+    def test_index(self):
+        game = BattleManager([LilUzi(), BigTumpo()])
+        for mech in game.mechs:
+            for _ in range(12):
+                DrawCardAction(mech)(game)
+
+        indexed = [c for cards in game.reactions.values() for c in cards]
+        self.assertCountEqual(indexed, [
+            c for m in game.mechs for c in m.hand if c.triggers])
+        self.assertEqual(len(indexed), 3)
+
+    def test_reactions(self):
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo])
+        tumpo.add_to_hand(ReinforcedActuators(tumpo))
+        uzi.add_to_hand(armor := AblativeArmor(uzi))
+
+        attack = AttackAction(
+            phase=PHASE_SOLID_HIT,
+            source=tumpo, target=uzi,
+            range=EffectRange(melee=True),
+            initial_damage=3,
+        )
+        game.then(attack)
+        game.execute()
+
+        # +1 from the actuators, -1/2 from uzi's hull, -2 from the armor
+        self.assertEqual(attack.initial_damage, 4)
+        self.assertEqual(uzi.stress, Fraction(3, 2))
+        self.assertTrue(armor.scrapped)
+        self.assertNotIn(armor, uzi.hand)
+        self.assertNotIn(armor, sum(game.reactions.values(), []))
+
+
+class EligibilityTests(unittest.TestCase):
+    def test_cached_until_hand_changes(self):
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo])
+        boosts = [JetBoost(uzi) for _ in range(3)]
+        for boost in boosts:
+            uzi.add_to_hand(boost)
+
+        game.then(AttackAction(phase=PHASE_MISSED_ATTACK, source=tumpo,
+            target=uzi, offense=0, defense=1, defense_skill=Stats.parse("+AGI")))
+        game.execute()
+
+        # three checks, then one cached answer fewer after each reaction
+        self.assertEqual(uzi.heat, 6)
+        self.assertEqual((game.eligible_misses, game.eligible_hits), (3, 3))
+        self.assertEqual(game.eligible_hit_rate, 0.5)
+
+        game.then(AttackAction(phase=PHASE_MISSED_ATTACK, source=tumpo,
+            target=uzi, offense=0, defense=1, defense_skill=Stats.parse("+AGI")))
+        self.assertEqual(len(game.getPossibleReactions()), 3)
+        uzi.remove_from_hand(boosts[0])
+        self.assertCountEqual(game.getPossibleReactions(), boosts[1:])
+        self.assertEqual(game.eligible_misses, 8)
+
+
+class SeedTests(unittest.TestCase):
+    def battle(self, seed):
+        game = BattleManager([LilUzi(), BigTumpo()], seed=seed, record=True)
+        game.play()
+        return game.log
+
+    def test_independent_streams(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        seeds = [split_seed(7, k) for k in range(16)]
+        self.assertEqual(len(set(seeds)), 16)
+        self.assertEqual(seeds, [split_seed(7, k) for k in range(16)])
+
+        expected = [self.battle(seed) for seed in seeds]
+        with ThreadPoolExecutor(4) as pool:
+            random.seed(0)
+            self.assertEqual(list(pool.map(self.battle, seeds)), expected)
+
+
+class SimulateTests(unittest.TestCase):
+    def test_elimination(self):
+        game = BattleManager([LilUzi(), BigTumpo()], seed=1)
+        result = game.simulate()
+
+        self.assertEqual(result.reason, REASON_ELIMINATED)
+        self.assertEqual(result.winner, 'blue')
+        self.assertGreater(result.stress[0], game.mechs[0].reactorLimit)
+        self.assertEqual(result.heat, (0, 0))
+        self.assertEqual(game.active, [game.mechs[1]])
+
+    def test_max_actions(self):
+        game = BattleManager([LilUzi(), BigTumpo()], seed=1)
+        result = game.simulate(max_actions=12)
+
+        self.assertEqual(result.reason, REASON_MAX_ACTIONS)
+        self.assertIsNone(result.winner)
+        self.assertEqual(result.actions, 12)
+
+        for budget in 0, -5:
+            with self.assertRaises(ValueError):
+                BattleManager([LilUzi(), BigTumpo()], seed=1).simulate(budget)
+
+        # a budget already spent stops the battle after the next action
+        game = BattleManager([LilUzi(), BigTumpo()], seed=1)
+        for _ in range(5):
+            game.turn()
+        spent = game.actions
+        result = game.simulate(max_actions=2)
+        self.assertEqual(result.reason, REASON_MAX_ACTIONS)
+        self.assertEqual(result.actions, spent + 1)
+
+    def test_out_of_cards(self):
+        uzi, tumpo = LilUzi(), BigTumpo()
+        uzi.deck = uzi.deck[:4]
+        result = BattleManager([uzi, tumpo], seed=1).simulate()
+
+        self.assertEqual(result.reason, REASON_OUT_OF_CARDS)
+
+
+class PositionTests(unittest.TestCase):
+    def test_last_mech_rule(self):
+        front = dict(frontline=True, backline=False)
+        back = dict(frontline=False, backline=True)
+        a, b = BattleMech(3, team='red', **front), BattleMech(3, team='red', **back)
+        c, d = BattleMech(3, team='blue', **front), BattleMech(3, team='blue', **back)
+        game = BattleManager([a, b, c, d])
+
+        self.assertEqual(game.distance(a, c), CLOSE_RANGE)
+        self.assertEqual(game.distance(a, d), MID_RANGE)
+        self.assertEqual(game.distance(b, d), LONG_RANGE)
+        self.assertEqual(game.targets(a, FragGrenade.range), [c])
+        self.assertEqual(game.targets(b, FragGrenade.range), [])
+        self.assertEqual(game.targets(b, Snipe.range), [c, d])
+
+        game.meltdown(c)
+        self.assertEqual(game.distance(a, d), CLOSE_RANGE)
+        self.assertEqual(game.targets(a, FragGrenade.range), [d])
+
+        game.move(b, frontline=True, backline=False)
+        self.assertEqual(game.targets(b, FragGrenade.range), [d])
+
+    def test_lanes(self):
+        # targets and who can act, against scanning every mech
+        def expected(game, source, reach):
+            sizes = Counter(m.team for m in game.active)
+            def lines(m):
+                return (True, True) if sizes[m.team] == 1 else (m.frontline, m.backline)
+            return [m for m in game.active if m.team != source.team and
+                reach.covers(line_distance(False, *lines(source), *lines(m)))]
+
+        for seed in range(5):
+            game = BattleManager(bench.skirmish(5)(), seed=seed)
+            while game.result is None:
+                self.assertEqual([game.mechs[i] for i in game.ready],
+                    [m for m in game.active if len(m.hand) == m.handsize])
+                for source in game.active:
+                    for reach in FragGrenade.range, Snipe.range, Overswing.range:
+                        self.assertEqual(game.targets(source, reach),
+                            expected(game, source, reach))
+                game.turn()
+            self.assertTrue(any(m.melted for m in game.mechs))
+
+
+class SnapshotTests(unittest.TestCase):
+    def state(self, game):
+        return [m.save() for m in game.mechs], game.result and vars(game.result)
+
+    def test_restore(self):
+        uzi, tumpo = LilUzi(), BigTumpo()
+        uzi.deck.reverse()
+        game = BattleManager([uzi, tumpo], seed=5, record=True)
+        for _ in range(8):
+            game.turn()
+
+        snapshot = game.snapshot()
+        before = self.state(game)
+        log = list(game.log)
+
+        first = game.simulate()
+        after = self.state(game)
+        self.assertTrue(any(c.scrapped for c in game.cards))
+
+        for _ in range(3):
+            game.restore(snapshot)
+            self.assertEqual(self.state(game), before)
+            self.assertEqual(game.log, log)
+
+            self.assertEqual(vars(game.simulate()), vars(first))
+            self.assertEqual(self.state(game), after)
+
+
+class PilotTests(unittest.TestCase):
+    def test_custom_pilot(self):
+        class Newest(Pilot):
+            def choose_card(self, gamestate, mech):
+                self.played.append(mech.hand[0])
+                return mech.hand[0]
+
+        uzi = LilUzi()
+        uzi.pilot = Newest()
+        uzi.pilot.played = []
+        BattleManager([uzi, BigTumpo()], seed=1).simulate()
+        self.assertTrue(uzi.pilot.played)
+
+    def test_own_reactions(self):
+        class Brace(Card):
+            triggers = (AttackAction, PHASE_SOLID_HIT, TRIGGER_ANY),
+
+            def canReactTo(self, gamestate):
+                return True
+
+            def playReactively(self, gamestate):
+                pass
+
+        class Asked(Pilot):
+            def choose_reaction(self, gamestate, possible):
+                asked.append([card.mech for card in possible])
+                return possible[0]
+
+        asked = []
+        tumpo, uzi = BigTumpo(), LilUzi()
+        tumpo.pilot = uzi.pilot = Asked()
+        game = BattleManager([uzi, tumpo])
+        for mech in (uzi, tumpo, uzi):
+            mech.add_to_hand(Brace(mech))
+
+        game.then(AttackAction(phase=PHASE_SOLID_HIT, source=tumpo, target=uzi,
+            initial_damage=1))
+        game.execute()
+        # every card gets to react, each offered to its own pilot only
+        self.assertEqual(sorted(map(len, asked)), [1, 1, 2])
+        self.assertTrue(all(len(set(mechs)) == 1 for mechs in asked))
+
+    def test_mcts(self):
+        results = []
+        for seed in range(3):
+            uzi = LilUzi()
+            uzi.deck.reverse()
+            uzi.pilot = mcts.MCTSPilot(budget=None, iterations=30, seed=seed)
+
+            game = BattleManager([uzi, BigTumpo()], seed=seed, record=True)
+            results.append(game.simulate())
+
+            # the search leaves no trace in the real battle
+            self.assertEqual(game.pilots[0], uzi.pilot)
+            self.assertEqual(len(game.log), len(list(game.transcript())))
+
+        # the default pilot loses all of these
+        self.assertNotIn('blue', [r.winner for r in results])
+
+    def test_mcts_reused_tree(self):
+        # the kept subtree's favourite card got scrapped in the real battle
+        uzi, tumpo = LilUzi(), BigTumpo()
+        uzi.deck = []
+        for card in BurstFire, BurstFire, Reload:
+            uzi.add_to_hand(card(uzi))
+        uzi.pilot = mcts.MCTSPilot(budget=None, iterations=5, seed=0)
+        game = BattleManager([uzi, tumpo], seed=0)
+
+        uzi.pilot.game, uzi.pilot.root = game, mcts.Node()
+        uzi.pilot.root.children[AblativeArmor] = mcts.Node()
+        uzi.pilot.root.children[AblativeArmor].visits = 1000
+
+        self.assertIn(uzi.pilot.choose_card(game, uzi), uzi.hand)
+
+
+class LogTests(unittest.TestCase):
+    def test_silent(self):
+        game = BattleManager([LilUzi(), BigTumpo()], seed=1)
+        game.play()
+        self.assertIsNone(game.log)
+        self.assertEqual(list(game.transcript()), [])
+
+    def test_record(self):
+        game = BattleManager([LilUzi(), BigTumpo()], seed=1, record=True)
+        game.play()
+
+        self.assertTrue(all(len(event) == 5 for event in game.log))
+        self.assertIn((Bonk, EVENT_PLAYED, 1, None, None), game.log)
+
+        text = list(game.transcript())
+        self.assertEqual(len(text), len(game.log))
+        self.assertIn('BigTumpo plays Bonk', text)
+
+
+class ProfileTests(unittest.TestCase):
+    def test_counters(self):
+        tumpo, uzi = BigTumpo(), LilUzi()
+        game = BattleManager([uzi, tumpo], profile=True)
+        tumpo.add_to_hand(ReinforcedActuators(tumpo))
+        uzi.add_to_hand(AblativeArmor(uzi))
+
+        game.then(AttackAction(phase=PHASE_SOLID_HIT, source=tumpo, target=uzi,
+            range=EffectRange(melee=True), initial_damage=3))
+        game.execute()
+
+        rows = {row['action']: row for row in game.profile.rows()}
+        self.assertEqual(set(rows), {
+            'AttackAction :: Solid Hit',
+            'AttackAction :: Applying Armor Reduction',
+            'AttackAction :: Dealing Reactor Stress',
+            'Card.scrap_me'})
+        self.assertEqual(rows['AttackAction :: Solid Hit']['reactions'], 1)
+        self.assertEqual(rows['AttackAction :: Dealing Reactor Stress']['reactions'], 1)
+        self.assertTrue(all(row['calls'] == 1 for row in rows.values()))
+        self.assertEqual(json.loads(game.profile.to_json()), game.profile.rows())
+
+    def test_same_battle(self):
+        plain = BattleManager([LilUzi(), BigTumpo()], seed=4, record=True)
+        timed = BattleManager([LilUzi(), BigTumpo()], seed=4, record=True, profile=True)
+        plain.simulate()
+        timed.simulate()
+        self.assertEqual(timed.log, plain.log)
+        self.assertIsNone(plain.profile)
+
+        total = Profile().merge(timed.profile).merge(timed.profile)
+        self.assertEqual(sum(r['calls'] for r in total.rows()), 2 * timed.actions)
+
+
+    def test_searching_pilot(self):
+        # rollouts are not part of the battle, its counters don't see them
+        class Searching(mcts.MCTSPilot):
+            def choose_card(self, game, mech):
+                card = super().choose_card(game, mech)
+                picks.append(list(mech.hand).index(card))
+                return card
+
+        class Scripted(Pilot):
+            def choose_card(self, game, mech):
+                return mech.hand[picks.pop(0)]
+
+        def battle(pilot):
+            uzi = LilUzi()
+            uzi.pilot = pilot
+            game = BattleManager([uzi, BigTumpo()], seed=1, profile=True)
+            game.simulate()
+            return game
+
+        picks = []
+        searched = battle(Searching(budget=None, iterations=20, seed=0))
+        scripted = battle(Scripted())
+        def calls(game):
+            return {r['action']: r['calls'] for r in game.profile.rows()}
+        self.assertEqual(sum(calls(searched).values()), searched.actions)
+        self.assertEqual(calls(searched), calls(scripted))
+        self.assertEqual((searched.eligible_hits, searched.eligible_misses),
+            (scripted.eligible_hits, scripted.eligible_misses))
+
+
+class ReplayTests(unittest.TestCase):
+    def test_round_trip(self):
+        result, recorded = replay.record([LilUzi(), BigTumpo()], seed=3)
+        recorded = replay.Replay.loads(recorded.dumps())
+
+        original = BattleManager([LilUzi(), BigTumpo()], seed=3, record=True)
+        original.simulate()
+
+        game = replay.play(recorded, record=True)
+        self.assertEqual(game.result.stress, result.stress)
+        self.assertEqual(game.log, original.log)
+        self.assertLess(len(recorded.dumps()), 1000)
+
+    def test_searching_pilot(self):
+        uzi = LilUzi()
+        uzi.pilot = mcts.MCTSPilot(budget=None, iterations=20, seed=2)
+        result, recorded = replay.record([uzi, BigTumpo()], seed=5)
+        self.assertEqual(recorded.rerun, [[DECISION_TARGET, DECISION_REACTION],
+            [DECISION_CARD, DECISION_TARGET, DECISION_REACTION]])
+        self.assertEqual(replay.play(recorded).result.actions, result.actions)
+
+    def test_searching_pilot_targets(self):
+        # the search picks cards, targets are still the default pilot's draws
+        for seed in range(3):
+            gunner = GMS_Everest(name='Gunner')
+            gunner.equip(*[ShootPistol, GMSCore, Sidestep, Snipe] * 3)
+            gunner.team = 'red'
+            gunner.pilot = mcts.MCTSPilot(budget=None, iterations=8, seed=seed)
+            result, recorded = replay.record([gunner, BigTumpo()], seed=seed)
+            game = replay.play(replay.Replay.loads(recorded.dumps()))
+            self.assertEqual(game.result.stress, result.stress)
+
+    def test_divergence(self):
+        _, recorded = replay.record([LilUzi(), BigTumpo()], seed=3)
+
+        recorded.seed = 4
+        with self.assertRaises(replay.Divergence):
+            replay.play(recorded)
+
+        recorded.seed = 3
+        recorded.decisions = recorded.decisions[:-1]
+        with self.assertRaises(replay.Divergence):
+            replay.play(recorded)
+
+
+@unittest.skipIf(lockstep is None, 'needs numpy')
+class LockstepTests(unittest.TestCase):
+    def test_agrees_with_battlemanager(self):
+        dodgy = GMS_Everest(name='Dodgy')
+        dodgy.equip(
+            StabNSlice, JetBoost, EmergencyCoolant, Sidestep,
+            StabNSlice, JetBoost, GMSProcessor, ShootPistol,
+            FuelInjectors, JetBoost, StabNSlice, BurstFire,
+        )
+        dodgy.team = 'red'
+
+        flipped = LilUzi(), BigTumpo()
+        for mech in flipped:
+            mech.deck.reverse()
+
+        for matchup in (LilUzi(), BigTumpo()), flipped, (dodgy, BigTumpo()):
+            report = lockstep.validate(*matchup, battles=1000, seed=3)
+            self.assertLess(report['winner'], 0.05)
+            self.assertLess(report['reason'], 0.05)
+            self.assertLess(report['stress'], 0.1)
+            self.assertLess(report['heat'], 0.1)
+
+    def test_turn_cap(self):
+        battles = lockstep.LockstepBattles(LilUzi(), BigTumpo(), 10, seed=0).run(max_turns=2)
+        for result in battles.results():
+            self.assertIsNone(result.actions)
+            self.assertEqual(result.reason, lockstep.REASON_MAX_TURNS)
+
+
+    def test_attacks_from_definitions(self):
+        # lockstep reads a card's numbers from its definition, not a copy
+        (name, doc, stats, attacks), = parse_cards(
+            '=== Hard Burst ===\n'
+            'Melee attack, +4 vs AGI, onhit deal 5 damage\n'
+            'Melee attack, CPU vs HULL, onhit deal 2 piercing damage\n')
+        burst = compile_card(name, doc, stats, attacks)
+
+        (first, second) = lockstep.card_attacks(burst)
+        self.assertEqual(first[0], PHASE_ROLL_ACCURACY)
+        self.assertEqual(first[1:3], (Stats(bias=4), Stats(agi=1)))
+        self.assertEqual(first[4:], (True, 5, False))
+        self.assertEqual(second[1:3], (Stats(cpu=1), Stats(hull=1)))
+        self.assertEqual(second[4:], (True, 2, True))
+        self.assertEqual(lockstep.ATTACKS[Snipe], lockstep.card_attacks(Snipe))
+
+
+class OptimizerTests(unittest.TestCase):
+    def test_successive_halving(self):
+        candidates = optimizer.sample_loadouts(6, seed=1)
+        self.assertTrue(all(optimizer.legal(c) for c in candidates))
+
+        ranked = optimizer.successive_halving(candidates,
+            [loadouts.BIG_TUMPO, loadouts.LIL_UZI], battles=2, processes=2)
+
+        self.assertEqual(len(ranked), 6)
+        self.assertEqual([c.battles for c in ranked], [14, 14, 6, 2, 2, 2])
+        for c in ranked:
+            low, high = c.interval
+            self.assertLessEqual(low, c.win_rate)
+            self.assertLessEqual(c.win_rate, high)
+        self.assertIn('1', optimizer.leaderboard(ranked))
+
+        for keep in (0, 1, 1.5):
+            with self.assertRaises(ValueError):
+                optimizer.successive_halving(candidates, [loadouts.BIG_TUMPO], keep=keep)
+
+        ranked = optimizer.successive_halving(candidates[:3], [loadouts.BIG_TUMPO],
+            battles=1, keep=0.9, processes=1)
+        self.assertEqual([c.battles for c in ranked], [3, 3, 1])
+
+
+class BenchTests(unittest.TestCase):
+    def test_compare(self):
+        baseline = bench.run(battles=2, repeat=1, only='BigTumpo')
+        self.assertEqual(set(baseline['results']),
+            {'BigTumpo vs LilUzi battles/s', 'BigTumpo vs LilUzi actions/s'})
+
+        slower = {'results': {
+            name: rate / 2 for name, rate in baseline['results'].items()}}
+        rows, regressions = bench.compare(baseline, slower, threshold=0.1)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, list(baseline['results']))
+        self.assertEqual(bench.compare(baseline, baseline, 0.1)[1], [])
+
+    def test_scaling(self):
+        rows = bench.scaling(sizes=(1, 3), battles=4, repeat=1)
+        self.assertEqual([size for size, *_ in rows], [1, 3])
+        self.assertEqual(rows[0][2], 1.0)
+        self.assertTrue(all(rate > 0 for _, rate, _ in rows))
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        import os, tempfile
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'results.sqlite')
+
+    def test_hit(self):
+        with resultcache.ResultCache(self.path) as cache:
+            first = cache.simulate([LilUzi(), BigTumpo()], seed=3)
+        with resultcache.ResultCache(self.path) as cache:
+            second = cache.simulate([LilUzi(), BigTumpo()], seed=3)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            cache.simulate([BigTumpo(), LilUzi()], seed=3)
+            self.assertEqual(cache.misses, 1)
+
+        self.assertEqual(vars(second), vars(first))
+
+    def test_key_limits(self):
+        def key(**limits):
+            mechs = []
+            for team in 'red', 'blue':
+                mech = BattleMech(team=team, **{'handsize': 3, **limits})
+                mech.deck = [card(mech) for card in loadouts.LIL_UZI]
+                mechs.append(mech)
+            return resultcache.battle_key(mechs, 0, MAX_ACTIONS)
+
+        keys = {key(), key(reactorLimit=1), key(reactorLimit=50),
+            key(heat_gauge=2), key(handsize=4)}
+        self.assertEqual(len(keys), 5)
+        self.assertEqual(key(), key())
+
+    def test_eviction(self):
+        with resultcache.ResultCache(self.path, max_entries=2) as cache:
+            for seed in range(3):
+                cache.simulate([LilUzi(), BigTumpo()], seed=seed)
+                cache.commit()
+            # seed 0 was the least recently used, so it has to be played again
+            cache.simulate([LilUzi(), BigTumpo()], seed=0)
+            self.assertEqual(cache.misses, 4)
+            cache.commit()
+            self.assertEqual(len(cache), 2)
+
+    def test_engine_change(self):
+        from unittest import mock
+
+        with resultcache.ResultCache(self.path) as cache:
+            cache.simulate([LilUzi(), BigTumpo()], seed=3)
+        with mock.patch('resultcache.ENGINE_VERSION', 'edited'):
+            with resultcache.ResultCache(self.path) as cache:
+                self.assertEqual(len(cache), 0)
+
+    def test_runners(self):
+        plain = montecarlo.run_encounter([LilUzi()], [BigTumpo()],
+            games=20, processes=2)
+        for _ in range(2):
+            cached = montecarlo.run_encounter([LilUzi()], [BigTumpo()],
+                games=20, processes=2, cache=self.path)
+            self.assertEqual(cached.outcomes, plain.outcomes)
+        with resultcache.ResultCache(self.path) as cache:
+            self.assertEqual(len(cache), 20)
+
+
+class TournamentTests(unittest.TestCase):
+    def test_bradley_terry(self):
+        strengths = tournament.bradley_terry('abc',
+            {('a', 'b'): [8, 0, 2], ('b', 'c'): [5, 0, 5], ('a', 'c'): [0, 10, 0]})
+        self.assertGreater(strengths['a'], strengths['b'])
+        self.assertGreater(strengths['c'], strengths['b'])
+        self.assertAlmostEqual(strengths['a'] * strengths['b'] * strengths['c'], 1)
+
+    def test_add_loadout(self):
+        import os, tempfile
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'state.json')
+            t = tournament.Tournament(loadouts.LOADOUTS, games=2, path=path)
+            t.add('Random', optimizer.sample_loadouts(1, seed=1)[0])
+            t.run(processes=2)
+
+            self.assertEqual(len(t.played), 6)
+            for name, rating, wins, draws, losses in t.standings():
+                self.assertEqual(wins + draws + losses, 8)
+
+            loaded = tournament.Tournament.load(path)
+            self.assertEqual(loaded.table(), t.table())
+
+            loaded.add('Another', optimizer.sample_loadouts(1, seed=2)[0])
+            played = []
+            loaded.run(processes=2, progress=lambda done, total: played.append(total))
+            self.assertEqual(played, [6] * 6)
+            self.assertEqual(len(loaded.played), 12)
+
+
+class MonteCarloTests(unittest.TestCase):
+    def test_percentile(self):
+        self.assertEqual(montecarlo.skill_percentile(3, 3), 0.5)
+        self.assertGreater(montecarlo.skill_percentile(4, 1), 0.9)
+        self.assertLess(montecarlo.skill_percentile(1, 4), 0.1)
+        self.assertEqual(montecarlo.skill_percentile(0, 1000), 0.0)
+        self.assertEqual(montecarlo.skill_percentile(1000, 0), 1.0)
+
+    def test_encounter(self):
+        a = montecarlo.run_encounter([LilUzi()], [BigTumpo()],
+            games=40, processes=2)
+        b = montecarlo.run_encounter([LilUzi()], [BigTumpo()],
+            games=40, processes=4, skill_a=2)
+
+        self.assertEqual(len(a.outcomes), 40)
+        self.assertEqual(a.outcomes, b.outcomes)
+        self.assertEqual(a.outcomes, sorted(a.outcomes))
+        self.assertLessEqual(a.pick, b.pick)
+
+
+class ExactTests(unittest.TestCase):
+    def dodgy(self):
+        return loadouts.build('Dodgy', [
+            StabNSlice, JetBoost, EmergencyCoolant, Sidestep,
+            StabNSlice, JetBoost, GMSProcessor, ShootPistol,
+            FuelInjectors, JetBoost, StabNSlice, BurstFire,
+        ], 'red')
+
+    def test_no_dice(self):
+        result = BattleManager([LilUzi(), BigTumpo()], seed=1).simulate()
+        distribution = exact.exact_distribution([LilUzi(), BigTumpo()])
+        self.assertEqual(distribution, {
+            (result.winner, result.stress, result.heat, result.reason): 1})
+
+    def test_agrees_with_sampling(self):
+        mechs = [self.dodgy(), BigTumpo()]
+        distribution = exact.exact_distribution(mechs)
+        self.assertEqual(sum(distribution.values()), 1)
+        # the mechs are copied, not played
+        self.assertFalse(mechs[0].hand)
+
+        for seed in range(200):
+            result = BattleManager([self.dodgy(), BigTumpo()], seed=seed).simulate()
+            outcome = result.winner, result.stress, result.heat, result.reason
+            self.assertIn(outcome, distribution)
+
+    def test_encounter(self):
+        strong = exact.exact_encounter([self.dodgy()], [BigTumpo()], 4, 1)
+        weak = exact.exact_encounter([self.dodgy()], [BigTumpo()], 1, 4)
+        self.assertEqual(sum(strong.probabilities.values()), 1)
+        self.assertLessEqual(weak.pick, strong.pick)
+        self.assertIn(strong.pick, strong.outcomes)
+
+
+class ExportTests(unittest.TestCase):
+    def rows(self, n):
+        return export.battles(lambda: [LilUzi(), BigTumpo()], range(n))
+
+    def test_row(self):
+        row, = self.rows(1)
+        result = BattleManager([LilUzi(), BigTumpo()], seed=0).simulate()
+        self.assertEqual(row['winner'], 1)
+        self.assertEqual(row['actions'], result.actions)
+        self.assertEqual(row['team'], (0, 1))
+        self.assertEqual(row['stress'], tuple(int(s * HALF_POINTS) for s in result.stress))
+        self.assertNotEqual(*row['loadout'])
+        self.assertTrue(all(0 < n <= 12 for n in row['played']))
+
+    def test_played(self):
+        # a reaction scrapping a card doesn't make it played
+        game = BattleManager([LilUzi(), BigTumpo()], seed=0)
+        game.simulate()
+        before = export.summarize(game, 0)['played']
+        mech = next(m for m in game.mechs if m.hand)
+        mech.hand[0].scrap_me(game)
+        self.assertEqual(export.summarize(game, 0)['played'], before)
+
+    def test_csv(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertEqual(export.export(self.rows(5), folder, 'csv', shard_rows=2), 5)
+            export.export(self.rows(1), folder, 'csv')
+            self.assertEqual(len(export.shard_paths(folder)), 4)
+            self.assertEqual(list(export.read(folder)), [*self.rows(5), *self.rows(1)])
+
+            with self.assertRaises(ValueError):
+                export.Shards(folder, 'npy')
+
+    @unittest.skipIf(export.np is None, 'needs numpy')
+    def test_npy(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as folder:
+            export.export(self.rows(5), folder, shard_rows=2)
+            arrays = list(export.shards(folder))
+            self.assertEqual([len(a) for a in arrays], [2, 2, 1])
+            self.assertEqual(arrays[0]['stress'].shape, (2, 2))
+            self.assertEqual(list(export.read(folder)), list(self.rows(5)))
+            self.assertEqual(export.summary(folder)[:2], (5, 0))
+
+
+class ServiceTests(unittest.TestCase):
+    def test_coalesce(self):
+        import asyncio
+
+        async def ask(port, request):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(json.dumps(request).encode() + b'\n')
+            answer = json.loads(await reader.readline())
+            writer.close()
+            return answer
+
+        async def run():
+            s = service.Service(processes=2)
+            host, port = await s.start(port=0)
+            try:
+                answers = await asyncio.gather(*(
+                    ask(port, {'a': 'LilUzi', 'b': 'BigTumpo', 'games': 20, 'skill_a': skill})
+                    for skill in (0, 2, 2, 4)))
+                error = await ask(port, {'a': 'LilUzi', 'b': ['Nope']})
+                return answers, error, s.stats()
+            finally:
+                await s.close()
+
+        answers, error, stats = asyncio.run(run())
+        for answer, skill in zip(answers, (0, 2, 2, 4)):
+            expected = montecarlo.run_encounter([LilUzi()], [BigTumpo()],
+                games=20, skill_a=skill, processes=2)
+            self.assertEqual(answer['pick'], str(expected.pick))
+        self.assertIn('Nope', error['error'])
+        self.assertEqual(stats['encounters'], 1)
+        self.assertEqual(stats['coalesced'], 3)
+
+    def test_errors(self):
+        import asyncio
+
+        async def fail(*battles):
+            raise RuntimeError('worker died')
+
+        async def run():
+            s = service.Service(processes=1)
+            try:
+                answers = [await s.answer(json.dumps(request)) for request in (
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'skill_a': None},
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'skill_a': True},
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'skill_a': '2'},
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'skill_b': 1e400},
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'skill_b': 1000, 'games': 5},
+                    {'a': 'LilUzi', 'b': [['GMSCore']]})]
+                s.play = fail
+                answers.append(await s.answer(json.dumps(
+                    {'a': 'LilUzi', 'b': 'BigTumpo', 'seed': 1})))
+                return answers
+            finally:
+                await s.close()
+
+        *bad, far, nested, failed = asyncio.run(run())
+        for answer in bad:
+            self.assertIn('skills must be', answer['error'])
+        self.assertEqual(far['games'], 5)
+        self.assertEqual(far['percentile'], 0.0)
+        self.assertIn('unknown card', nested['error'])
+        self.assertIn('worker died', failed['error'])
+
+    def test_client(self):
+        import asyncio, threading
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        s = service.Service(processes=1)
+        host, port = asyncio.run_coroutine_threadsafe(s.start(port=0), loop).result()
+        try:
+            with service.Client(host, port) as client:
+                pick = client.encounter('LilUzi', 'BigTumpo', games=10)
+                self.assertEqual(pick, montecarlo.run_encounter(
+                    [LilUzi()], [BigTumpo()], games=10, processes=1).pick)
+                with self.assertRaises(service.ServiceError):
+                    client.encounter('LilUzi', 'Nobody')
+                self.assertEqual(client.stats()['requests'], 1)
+        finally:
+            asyncio.run_coroutine_threadsafe(s.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
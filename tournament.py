@@ -0,0 +1,256 @@
+"""
+Round-robin tournament over a library of loadouts, ranked with a
+Bradley-Terry fit shown on the Elo scale.
+
+Every pairing plays `games` battles in each seat order, as jobs on a
+process pool. Results stream into the fit as jobs finish, and the whole
+state (library, results so far) is written to a JSON file after every
+job, so `python tournament.py --show state.json` reads the standings of
+a tournament that is still running. Adding a loadout to a finished
+tournament only plays the new pairings.
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import contextlib
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import main
+import loadouts
+import resultcache
+
+from main import BattleManager, split_seed
+
+
+GAMES = 20
+
+# each pairing starts from one drawn game, so unbeaten loadouts
+# still get a finite rating
+PRIOR = 0.5
+
+
+def play_pairing(first, second, seeds, cache=None):
+    # wins for the first seat, draws, wins for the second seat
+    def play(results):
+        tally = [0, 0, 0]
+        for seed in seeds:
+            mechs = [
+                loadouts.build('First', first, 'first'),
+                loadouts.build('Second', second, 'second'),
+            ]
+            if results is None:
+                result = BattleManager(mechs, seed=seed).simulate()
+            else:
+                result = results.simulate(mechs, seed)
+            tally[{'first': 0, None: 1, 'second': 2}[result.winner]] += 1
+        return tally
+
+    if cache is None:
+        return play(None)
+    with resultcache.ResultCache(cache) as results:
+        return play(results)
+
+
+def bradley_terry(names, records, strengths=None, iterations=200, tolerance=1e-9):
+    """
+    Strength per loadout from {(a, b): [a wins, draws, b wins]}, fitted
+    with the MM updates, draws count as half a win for each side.
+    Pass the previous fit as `strengths` to start from it.
+    """
+    strengths = {n: (strengths or {}).get(n, 1.0) for n in names}
+    wins = dict.fromkeys(names, 0.0)
+    games = {}
+    for (a, b), (a_wins, draws, b_wins) in records.items():
+        wins[a] += a_wins + draws/2 + PRIOR
+        wins[b] += b_wins + draws/2 + PRIOR
+        games[a, b] = a_wins + draws + b_wins + 2*PRIOR
+
+    for _ in range(iterations):
+        totals = dict.fromkeys(names, 0.0)
+        for (a, b), n in games.items():
+            share = n / (strengths[a] + strengths[b])
+            totals[a] += share
+            totals[b] += share
+
+        fitted = {n: wins[n] / totals[n] if totals[n] else 1.0 for n in names}
+        # pin the geometric mean to 1, the fit is only defined up to scale
+        scale = math.exp(sum(map(math.log, fitted.values())) / len(fitted))
+        fitted = {n: s / scale for n, s in fitted.items()}
+
+        change = max(abs(fitted[n] - strengths[n]) for n in names)
+        strengths = fitted
+        if change < tolerance:
+            break
+    return strengths
+
+
+def elo(strength):
+    return 1500 + 400 * math.log10(strength)
+
+
+class Tournament:
+    def __init__(self, library, games=GAMES, seed=0, path=None, cache=None):
+        self.library = dict(library)    # name -> card list
+        self.games = games
+        self.seed = seed
+        self.path = path                # JSON state, written after every job
+        self.cache = cache              # ResultCache path, or None
+
+        # (a, b) with a before b in the library -> [a wins, draws, b wins]
+        self.records = {}
+        # (first seat, second seat) pairings that have been played
+        self.played = set()
+        self.strengths = {}
+
+    # ------------ scheduling ---------------
+
+    def pairings(self):
+        # every ordered pair that hasn't been played yet
+        names = list(self.library)
+        return [(a, b) for a in names for b in names
+            if a != b and (a, b) not in self.played]
+
+    def add(self, name, cards):
+        # the next run plays only the pairings with the newcomer
+        if name in self.library:
+            raise ValueError(f'{name} is already in the tournament')
+        self.library[name] = list(cards)
+
+    def seeds(self, first, second):
+        # the same seeds for a pairing whenever it is played
+        return [split_seed(self.seed, f'{first}/{second}/{i}')
+            for i in range(self.games)]
+
+    def run(self, processes=None, pool=None, progress=None):
+        """
+        Play every missing pairing. Calls progress(done, total) after
+        each one, the standings are up to date by then.
+        """
+        todo = self.pairings()
+        with contextlib.ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(ProcessPoolExecutor(processes))
+
+            jobs = {
+                pool.submit(play_pairing,
+                    self.cards(first), self.cards(second),
+                    self.seeds(first, second), self.cache): (first, second)
+                for first, second in todo
+            }
+            for done, job in enumerate(as_completed(jobs), 1):
+                self.record(*jobs[job], job.result())
+                if progress:
+                    progress(done, len(todo))
+        return self.standings()
+
+    def cards(self, name):
+        # the library may hold card names, as loaded from a state file
+        return [main.CARDS[card] if isinstance(card, str) else card
+            for card in self.library[name]]
+
+    def record(self, first, second, tally):
+        names = list(self.library)
+        first_wins, draws, second_wins = tally
+        if names.index(first) < names.index(second):
+            key, tally = (first, second), (first_wins, draws, second_wins)
+        else:
+            key, tally = (second, first), (second_wins, draws, first_wins)
+
+        totals = self.records.setdefault(key, [0, 0, 0])
+        for i, n in enumerate(tally):
+            totals[i] += n
+        self.played.add((first, second))
+
+        self.strengths = bradley_terry(names, self.records, self.strengths)
+        if self.path:
+            self.save()
+
+    # ------------ standings ---------------
+
+    def standings(self):
+        # (name, rating, wins, draws, losses), best first
+        score = {n: [0, 0, 0] for n in self.library}
+        for (a, b), (a_wins, draws, b_wins) in self.records.items():
+            for name, won, lost in (a, a_wins, b_wins), (b, b_wins, a_wins):
+                score[name][0] += won
+                score[name][1] += draws
+                score[name][2] += lost
+
+        return sorted(
+            ((n, elo(self.strengths.get(n, 1.0)), *score[n]) for n in self.library),
+            key=lambda row: -row[1])
+
+    def table(self):
+        total = len(self.library) * (len(self.library) - 1)
+        lines = [f'{len(self.played)}/{total} pairings played',
+            f'{"#":>3} {"elo":>6} {"W":>5} {"D":>5} {"L":>5}  loadout']
+        for rank, (name, rating, wins, draws, losses) in enumerate(self.standings(), 1):
+            lines.append(f'{rank:>3} {rating:>6.0f} {wins:>5} {draws:>5} {losses:>5}  {name}')
+        return '\n'.join(lines)
+
+    # ------------ state ---------------
+
+    def save(self):
+        # written whole and renamed into place, so readers never see half a file
+        state = {
+            'games': self.games,
+            'seed': self.seed,
+            'library': {n: [c if isinstance(c, str) else c.__name__ for c in cards]
+                for n, cards in self.library.items()},
+            'records': [[a, b, tally] for (a, b), tally in self.records.items()],
+            'played': sorted(self.played),
+            'strengths': self.strengths,
+        }
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    @classmethod
+    def load(cls, path, cache=None):
+        with open(path) as f:
+            state = json.load(f)
+        tournament = cls(state['library'], state['games'], state['seed'], path, cache)
+        tournament.records = {(a, b): tally for a, b, tally in state['records']}
+        tournament.played = {tuple(pair) for pair in state['played']}
+        tournament.strengths = state['strengths']
+        return tournament
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('state', help='JSON file holding the tournament')
+    parser.add_argument('--show', action='store_true',
+        help='print the standings so far and stop')
+    parser.add_argument('--add', nargs='+', metavar=('NAME', 'CARD'),
+        help='add a loadout, a name then its twelve cards')
+    parser.add_argument('--games', type=int, default=GAMES,
+        help='battles per pairing and seat order, for a new tournament')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--cache', default=resultcache.DEFAULT_PATH,
+        help='result cache to check before playing')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.state):
+        tournament = Tournament.load(args.state, cache=args.cache)
+    else:
+        tournament = Tournament(loadouts.LOADOUTS, args.games,
+            path=args.state, cache=args.cache)
+
+    if args.show:
+        print(tournament.table())
+        return 0
+    if args.add:
+        name, *cards = args.add
+        tournament.add(name, [main.CARDS[c].__name__ for c in cards])
+
+    tournament.run(args.processes, progress=lambda done, total:
+        print(f'{done}/{total}', file=sys.stderr, end='\r'))
+    print(tournament.table())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())